@@ -0,0 +1 @@
+from openmotorsport import load_many
@@ -0,0 +1,122 @@
+#!/usr/bin/python2.6
+#
+# Support for opening sessions and reading channels from asyncio.
+#
+# Author: Martin Galpin (m@66laps.com)
+#
+# Copyright 2007 66laps Limited. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Opening a session or reading a channel inflates zip entries, which blocks an
+asyncio event loop. The functions of this module instead run that work on a
+shared pool of MAX_WORKERS threads (so concurrency is bounded however many
+requests are waiting) and return asyncio futures. For example:
+
+>>> session = await Session.aopen('stint.om')
+>>> await session.get_channel_by_id(0).timeseries.aload()
+>>> async for chunk in session.get_channel_by_id(1).timeseries.achunks():
+...   send(chunk.data)
+
+Cancelling a future before its work has started removes it from the pool,
+and cancelling an iteration over chunks stops before the next chunk is read.
+This module requires asyncio (Python 3.4+) or trollius and
+concurrent.futures (or the futures backport).
+'''
+
+import functools, threading
+
+try:
+  import asyncio
+except ImportError:
+  try:
+    import trollius as asyncio
+  except ImportError:
+    asyncio = None
+
+try:
+  from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+  ThreadPoolExecutor = None
+
+try:
+  StopAsyncIteration = StopAsyncIteration
+except NameError:
+  class StopAsyncIteration(Exception):
+    '''Signals the end of an asynchronous iteration (before Python 3.5).'''
+
+MAX_WORKERS = 8
+'''The default number of threads that blocking work is run on.'''
+
+_executor = None
+_lock = threading.Lock()
+
+def executor():
+  '''Gets the shared concurrent.futures.ThreadPoolExecutor.'''
+  global _executor
+  if asyncio is None or ThreadPoolExecutor is None:
+    raise ImportError('The async API requires asyncio (or trollius) and '
+                      'concurrent.futures')
+  with _lock:
+    if _executor is None:
+      _executor = ThreadPoolExecutor(MAX_WORKERS)
+    return _executor
+
+def set_max_workers(workers):
+  '''
+  Sets the number of threads that blocking work is run on. Work already
+  submitted completes on the previous threads.
+  '''
+  global _executor, MAX_WORKERS
+  with _lock:
+    MAX_WORKERS = workers
+    previous, _executor = _executor, None
+  if previous is not None:
+    previous.shutdown(wait=False)
+
+def run(function, *args, **kwargs):
+  '''
+  Runs function(*args, **kwargs) on the shared executor and returns an
+  asyncio.Future of its result. An event loop may be given as `loop`,
+  otherwise the current event loop is used.
+  '''
+  loop = kwargs.pop('loop', None)
+  pool = executor()
+  if loop is None:
+    loop = asyncio.get_event_loop()
+  return loop.run_in_executor(pool, functools.partial(function, *args, **kwargs))
+
+class AsyncIterator(object):
+  '''
+  An asynchronous iterator over a (blocking) iterable, where each item is
+  produced on the shared executor. The iterable is advanced by one item at a
+  time, so abandoning (or cancelling) an iteration stops it.
+  '''
+
+  def __init__(self, iterable, loop=None):
+    self._iterator = iter(iterable)
+    self._loop = loop
+
+  def __aiter__(self):
+    return self
+
+  def __anext__(self):
+    '''Gets an asyncio.Future of the next item.'''
+    return run(self._next, loop=self._loop)
+
+  def _next(self):
+    try:
+      return next(self._iterator)
+    except StopIteration:
+      raise StopAsyncIteration()
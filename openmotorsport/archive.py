@@ -0,0 +1,295 @@
+#!/usr/bin/python2.6
+#
+# Low-level access to the binary entries of an OpenMotorsport archive.
+#
+# Author: Martin Galpin (m@66laps.com)
+#
+# Copyright 2007 66laps Limited. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime, struct, zipfile, zlib
+import numpy as np
+
+CHUNK_SIZE = 1 << 20
+'''The number of bytes inflated (or deflated) from an archive entry at a time.'''
+
+def read_array(archive, arcname, dtype, out=None):
+  '''
+  Reads a binary entry from an open zipfile.ZipFile straight into a newly
+  allocated numpy array of a given dtype. The entry is inflated in chunks of
+  CHUNK_SIZE bytes so that nothing is written to the filesystem and at most
+  one chunk is held in addition to the array itself. A contiguous array of
+  the entry's size may be given as `out` to read into instead.
+
+  Raises KeyError if the entry does not exist and IOError if the entry ends
+  before its recorded size.
+  '''
+  info = archive.getinfo(arcname)
+  array = out
+  if array is None:
+    array = np.empty(info.file_size // np.dtype(dtype).itemsize, dtype=dtype)
+  buf = array.view(np.uint8)
+
+  stream = archive.open(info)
+  try:
+    offset = 0
+    while offset < buf.size:
+      chunk = stream.read(min(CHUNK_SIZE, buf.size - offset))
+      if not chunk:
+        raise IOError('Unexpected end of archive entry %s' % arcname)
+      buf[offset:offset + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+      offset += len(chunk)
+  finally:
+    stream.close()
+
+  return array
+
+def map_array(archive, source, arcname, dtype):
+  '''
+  Gets a copy-on-write numpy.memmap over a binary entry of an archive that
+  was written without compression (zipfile.ZIP_STORED). The array is a view
+  of the entry's bytes within the archive file itself, so nothing is read or
+  decoded until it is accessed.
+
+  Returns None if the entry cannot be mapped (it is compressed, encrypted or
+  empty, or the source is not a path), in which case read_array should be
+  used instead. NB: entries of an mmap.mmap are read rather than viewed, as
+  a view would outlive the mapping being closed (which Python 2 does not
+  prevent).
+  '''
+  info = archive.getinfo(arcname)
+  if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1 or \
+     not info.file_size:
+    return None
+
+  count = info.file_size // np.dtype(dtype).itemsize
+  if isinstance(source, basestring):
+    return np.memmap(source, dtype=dtype, mode='c',
+                     offset=data_offset(archive, info), shape=(count,))
+  return None
+
+def data_offset(archive, info):
+  '''
+  Gets the absolute offset of the first byte of an entry's data within the
+  archive file (the local file header is variable length so it must be read).
+  '''
+  archive.fp.seek(info.header_offset)
+  header = struct.unpack(zipfile.structFileHeader,
+                         archive.fp.read(zipfile.sizeFileHeader))
+  return info.header_offset + zipfile.sizeFileHeader + \
+    header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH]
+
+def write_array(archive, arcname, array, compress_type=None,
+                level=zlib.Z_DEFAULT_COMPRESSION):
+  '''
+  Writes a numpy array to a new entry of a zipfile.ZipFile opened for writing.
+  The array's buffer is streamed into the entry in chunks of CHUNK_SIZE bytes,
+  so no temporary file or full-size copy of the array is made.
+  '''
+  write_entry(archive, arcname, iter_chunks(array), array.nbytes,
+              compress_type, level)
+
+def iter_chunks(array, size=CHUNK_SIZE):
+  '''Gets an iterator over views of at most `size` bytes of an array.'''
+  buf = np.ascontiguousarray(array).ravel().view(np.uint8)
+  for offset in xrange(0, buf.size, size):
+    yield buf[offset:offset + size]
+
+def write_entry(archive, arcname, chunks, size, compress_type=None,
+                level=zlib.Z_DEFAULT_COMPRESSION):
+  '''
+  Writes an iterable of chunks (strings or objects supporting the buffer
+  protocol) to a new entry of a zipfile.ZipFile opened for writing. `size` is
+  the expected uncompressed size of the entry, which is used to decide whether
+  ZIP64 extensions are required. `level` is the zlib compression level of a
+  deflated entry.
+
+  As with zipfile.ZipFile.write, the local file header is written first and
+  then rewritten with the CRC and sizes once the data has been written, unless
+  the archive is being written to an UnseekableStream, in which case they are
+  written after the data in a data descriptor.
+  '''
+  if compress_type is None:
+    compress_type = archive.compression
+  zinfo, zip64 = _begin_entry(archive, arcname, size, compress_type)
+
+  if compress_type == zipfile.ZIP_DEFLATED:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+  else:
+    compressor = None
+
+  crc = file_size = compress_size = 0
+  for chunk in chunks:
+    file_size += len(chunk)
+    crc = zlib.crc32(chunk, crc) & 0xffffffff
+    if compressor:
+      chunk = compressor.compress(chunk)
+    compress_size += len(chunk)
+    _write(archive.fp, chunk)
+  if compressor:
+    chunk = compressor.flush()
+    compress_size += len(chunk)
+    archive.fp.write(chunk)
+
+  _end_entry(archive, zinfo, zip64, crc, file_size, compress_size)
+
+def deflate_array(array, level=zlib.Z_DEFAULT_COMPRESSION):
+  '''
+  Deflates an array into the raw deflate stream of a zip entry, ahead of it
+  being written with write_deflated. This does not touch an archive, so many
+  arrays may be deflated concurrently (zlib releases the GIL).
+
+  Returns a tuple of the CRC, the uncompressed size and a list of compressed
+  chunks.
+  '''
+  compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+  crc, chunks = 0, []
+  for chunk in iter_chunks(array):
+    crc = zlib.crc32(chunk, crc)
+    chunks.append(compressor.compress(chunk))
+  chunks.append(compressor.flush())
+  return crc & 0xffffffff, array.nbytes, chunks
+
+def write_deflated(archive, arcname, crc, size, chunks):
+  '''
+  Writes an already deflated entry (as returned by deflate_array) to a
+  zipfile.ZipFile opened for writing.
+  '''
+  zinfo, zip64 = _begin_entry(archive, arcname, size, zipfile.ZIP_DEFLATED)
+  compress_size = 0
+  for chunk in chunks:
+    compress_size += len(chunk)
+    archive.fp.write(chunk)
+  _end_entry(archive, zinfo, zip64, crc, size, compress_size)
+
+def _write(fp, chunk):
+  '''
+  Private function. Writes a chunk to the file of an archive. Only real files
+  accept an array's buffer, so chunks are copied to strings for any other
+  stream (e.g. a StringIO).
+  '''
+  if not isinstance(fp, file) and hasattr(chunk, 'tostring'):
+    chunk = chunk.tostring()
+  fp.write(chunk)
+
+class MappedFile(object):
+  '''
+  A read-only file-like object over an mmap.mmap, from which a
+  zipfile.ZipFile can be read (mmap.mmap.read requires a size before Python
+  3.3).
+  '''
+
+  def __init__(self, mapped):
+    self._mmap = mapped
+
+  def read(self, size=-1):
+    if size is None or size < 0:
+      size = len(self._mmap) - self._mmap.tell()
+    return self._mmap.read(size)
+
+  def seek(self, offset, whence=0):
+    self._mmap.seek(offset, whence)
+
+  def tell(self):
+    return self._mmap.tell()
+
+  def close(self):
+    pass
+
+class UnseekableStream(object):
+  '''
+  Wraps a writable stream that cannot seek (for example, a socket or a HTTP
+  response) so that a zipfile.ZipFile can be written to it. The position is
+  counted as it is written and entries are written with data descriptors
+  (rather than by rewriting their local file header).
+  '''
+
+  def __init__(self, stream):
+    self._stream = stream
+    self._position = 0
+
+  def write(self, data):
+    self._stream.write(data)
+    self._position += len(data)
+
+  def tell(self):
+    return self._position
+
+  def flush(self):
+    if hasattr(self._stream, 'flush'):
+      self._stream.flush()
+
+  def close(self):
+    '''Flushes (but does not close) the wrapped stream.'''
+    self.flush()
+
+def is_seekable(stream):
+  '''Gets whether a given file-like object can seek.'''
+  if hasattr(stream, 'seekable'):
+    return stream.seekable()
+  try:
+    stream.seek(stream.tell())
+    return True
+  except (AttributeError, IOError):
+    return False
+
+def _begin_entry(archive, arcname, size, compress_type):
+  '''Private method.
+  Writes a placeholder local file header for a new entry. Returns a tuple of
+  the entry's zipfile.ZipInfo and whether it requires ZIP64 extensions.
+  '''
+  zinfo = zipfile.ZipInfo(arcname, datetime.datetime.now().timetuple()[:6])
+  zinfo.external_attr = 0600 << 16L
+  if isinstance(archive.fp, UnseekableStream):
+    zinfo.flag_bits |= 0x08 # the CRC and sizes follow the data
+  zinfo.compress_type = compress_type
+  zinfo.file_size = size
+  zinfo.compress_size = zinfo.CRC = 0
+  zinfo.header_offset = archive.fp.tell()
+
+  archive._writecheck(zinfo)
+  archive._didModify = True
+
+  zip64 = archive._allowZip64 and size * 1.05 > zipfile.ZIP64_LIMIT
+  archive.fp.write(file_header(zinfo, zip64))
+  return zinfo, zip64
+
+def _end_entry(archive, zinfo, zip64, crc, file_size, compress_size):
+  '''Private method.
+  Rewrites the local file header of an entry with its CRC and sizes, once its
+  data has been written, and adds the entry to the archive's directory.
+  '''
+  zinfo.CRC = crc
+  zinfo.file_size = file_size
+  zinfo.compress_size = compress_size
+  if not zip64 and max(file_size, compress_size) > zipfile.ZIP64_LIMIT:
+    raise zipfile.LargeZipFile(
+      'Entry %s requires ZIP64 extensions' % zinfo.filename)
+
+  if zinfo.flag_bits & 0x08:
+    archive.fp.write(struct.pack(zip64 and '<4sLQQ' or '<4sLLL', 'PK\x07\x08',
+                                 crc, compress_size, file_size))
+  else:
+    position = archive.fp.tell()
+    archive.fp.seek(zinfo.header_offset)
+    archive.fp.write(file_header(zinfo, zip64))
+    archive.fp.seek(position)
+
+  archive.filelist.append(zinfo)
+  archive.NameToInfo[zinfo.filename] = zinfo
+
+def file_header(zinfo, zip64):
+  '''Gets the local file header of a zipfile.ZipInfo.'''
+  # NB: the zip64 argument is only supported (and needed) from Python 2.7
+  return zinfo.FileHeader(zip64) if zip64 else zinfo.FileHeader()
@@ -0,0 +1,182 @@
+#!/usr/bin/python2.6
+#
+# A process-wide cache of the channel data of lazily loaded sessions.
+#
+# Author: Martin Galpin (m@66laps.com)
+#
+# Copyright 2007 66laps Limited. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools, threading, weakref
+
+class ChannelCache(object):
+  '''
+  A least recently used cache of arrays with a budget in bytes. Every lazily
+  loaded time series reads its data (and times) through a cache, so that
+  however many sessions are open, at most `budget` bytes of channel data are
+  held. An evicted array is simply read from its archive again on its next
+  access. For example:
+
+  >>> from openmotorsport.cache import CACHE
+  >>> CACHE.budget = 8 << 30 # 8GB
+  >>> CACHE.hits, CACHE.misses, CACHE.evictions
+  (0, 0, 0)
+
+  A cache is safe to use from many threads.
+  '''
+
+  def __init__(self, budget=None):
+    '''
+    Creates a new instance of ChannelCache.
+
+    Args:
+      budget
+        The maximum number of bytes held by this cache. Defaults to no limit,
+        in which case arrays are only released when their time series is.
+        [optional]
+    '''
+    self._budget = budget
+    self._lock = threading.RLock()
+    self._entries = {}
+    # a circular doubly linked list of [previous, next, key, value, size]
+    # entries, least recently used first
+    self._head = []
+    self._head[:] = [self._head, self._head, None, None, 0]
+    self._owners = {}
+    self._released = []
+    self._keys = itertools.count()
+    self.size = 0
+    '''The number of bytes currently held.'''
+    self.hits = 0
+    '''The number of arrays returned from the cache.'''
+    self.misses = 0
+    '''The number of arrays that had to be loaded.'''
+    self.evictions = 0
+    '''The number of arrays evicted to stay within the budget.'''
+
+  def _getbudget(self):
+    return self._budget
+
+  def _setbudget(self, budget):
+    with self._lock:
+      self._budget = budget
+      self._purge()
+      self._evict()
+
+  budget = property(_getbudget, _setbudget)
+  '''The maximum number of bytes held by this cache (or None for no limit).
+  Reducing the budget evicts arrays immediately.'''
+
+  def key(self, owner):
+    '''
+    Gets a new unique key prefix for the arrays of a given owner (a time
+    series). The arrays cached under the prefix are discarded when the owner
+    is garbage collected.
+    '''
+    prefix = self._keys.next()
+    def release(ref):
+      # NB: this may run during any allocation (even whilst the lock is
+      # held) so the arrays are only discarded on the next access
+      self._owners.pop(prefix, None)
+      self._released.append(prefix)
+    self._owners[prefix] = weakref.ref(owner, release)
+    return prefix
+
+  def get(self, key, load):
+    '''
+    Gets the array cached under a given (prefix, name) key, calling `load` to
+    read it on a miss. The array is loaded outside the cache's lock so that
+    many threads may load concurrently.
+    '''
+    with self._lock:
+      self._purge()
+      entry = self._entries.get(key)
+      if entry is not None:
+        self.hits += 1
+        self._unlink(entry)
+        self._link(entry)
+        return entry[3]
+      self.misses += 1
+
+    value = load()
+    with self._lock:
+      if key not in self._entries:
+        entry = [None, None, key, value, getattr(value, 'nbytes', 0)]
+        self._entries[key] = entry
+        self._link(entry)
+        self.size += entry[4]
+        self._evict()
+    return value
+
+  def __contains__(self, key):
+    return key in self._entries
+
+  def discard(self, prefix, name=None):
+    '''
+    Discards the array cached under a given key, or every array under a
+    given prefix when no name is given.
+    '''
+    with self._lock:
+      if name is not None:
+        self._remove([(prefix, name)])
+      else:
+        self._remove([key for key in self._entries.keys() if key[0] == prefix])
+
+  def clear(self):
+    '''Discards every cached array (the counters are not reset).'''
+    with self._lock:
+      self._entries.clear()
+      self._head[:] = [self._head, self._head, None, None, 0]
+      self.size = 0
+
+  def _purge(self):
+    '''Private method. Discards the arrays of released owners.'''
+    while self._released:
+      prefix = self._released.pop()
+      self._remove([key for key in self._entries.keys() if key[0] == prefix])
+
+  def _remove(self, keys):
+    '''Private method. Removes the entries of given keys.'''
+    for key in keys:
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        self._unlink(entry)
+        self.size -= entry[4]
+
+  def _link(self, entry):
+    '''Private method. Links an entry as the most recently used.'''
+    last = self._head[0]
+    entry[0], entry[1] = last, self._head
+    last[1] = self._head[0] = entry
+
+  def _unlink(self, entry):
+    '''Private method. Unlinks an entry from the list.'''
+    entry[0][1], entry[1][0] = entry[1], entry[0]
+
+  def _evict(self):
+    '''Private method. Evicts the least recently used arrays over budget.'''
+    while self._budget is not None and self.size > self._budget and \
+          self._entries:
+      entry = self._head[1]
+      self._unlink(entry)
+      del self._entries[entry[2]]
+      self.size -= entry[4]
+      self.evictions += 1
+
+  def __repr__(self):
+    return 'ChannelCache (%d bytes, %d hits, %d misses, %d evictions)' % \
+      (self.size, self.hits, self.misses, self.evictions)
+
+CACHE = ChannelCache()
+'''The process-wide cache used by lazily loaded time series.'''
@@ -0,0 +1,312 @@
+#!/usr/bin/python2.6
+#
+# An on-disk catalog of OpenMotorsport sessions.
+#
+# Author: Martin Galpin (m@66laps.com)
+#
+# Copyright 2007 66laps Limited. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fnmatch, hashlib, os, sqlite3
+
+from openmotorsport import Session, to_iso8601_date
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+  id INTEGER PRIMARY KEY,
+  path TEXT UNIQUE NOT NULL,
+  mtime REAL NOT NULL,
+  size INTEGER NOT NULL,
+  hash TEXT NOT NULL,
+  user TEXT,
+  venue TEXT,
+  configuration TEXT,
+  vehicle TEXT,
+  year TEXT,
+  category TEXT,
+  date TEXT,
+  duration INTEGER,
+  datasource TEXT,
+  comments TEXT,
+  num_sectors INTEGER
+);
+CREATE TABLE IF NOT EXISTS channels (
+  session_id INTEGER NOT NULL REFERENCES sessions (id),
+  channel_id INTEGER NOT NULL,
+  name TEXT,
+  group_name TEXT,
+  units TEXT,
+  interval INTEGER
+);
+CREATE TABLE IF NOT EXISTS laps (
+  session_id INTEGER NOT NULL REFERENCES sessions (id),
+  lap INTEGER NOT NULL,
+  offset REAL,
+  length REAL,
+  incomplete INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sectors (
+  session_id INTEGER NOT NULL REFERENCES sessions (id),
+  lap INTEGER NOT NULL,
+  sector INTEGER NOT NULL,
+  time REAL
+);
+CREATE INDEX IF NOT EXISTS channels_session ON channels (session_id);
+CREATE INDEX IF NOT EXISTS channels_name ON channels (name);
+CREATE INDEX IF NOT EXISTS laps_session ON laps (session_id);
+CREATE INDEX IF NOT EXISTS laps_length ON laps (length);
+CREATE INDEX IF NOT EXISTS sectors_session ON sectors (session_id);
+'''
+'''The SQLite schema of a catalog.'''
+
+CRITERIA = ('user', 'venue', 'configuration', 'vehicle', 'year', 'category',
+            'datasource')
+'''The session columns that may be used as query criteria.'''
+
+class Catalog(object):
+  '''
+  An instance of openmotorsport.catalog.Catalog is an SQLite index of the
+  metadata, channels and lap and sector times of many OpenMotorsport files,
+  so that they can be queried without opening any archive. For example:
+
+  >>> catalog = Catalog('sessions.db')
+  >>> catalog.index('/data/sessions')
+  >>> catalog.laps(venue='Silverstone', vehicle='Van Diemen RF92',
+  ...              max_length=62000)
+  [('/data/sessions/2010-06-12.om', 4, 61890.0)]
+
+  Lap and sector times are in the same units as the session markers.
+  '''
+
+  def __init__(self, filepath):
+    '''
+    Opens (or creates) a catalog at a given filepath. An SQLite filepath of
+    ':memory:' creates a temporary in-memory catalog.
+    '''
+    self._db = sqlite3.connect(filepath)
+    self._db.executescript(SCHEMA)
+
+  def __enter__(self):
+    '''Context manager protocol. Returns self.'''
+    return self
+
+  def __exit__(self, type, value, traceback):
+    '''Context manager protocol. Automatically closes resources.'''
+    self.close()
+    return False
+
+  def close(self):
+    '''Close the catalog database.'''
+    self._db.close()
+
+  def index(self, directory, pattern='*.om'):
+    '''
+    Incrementally indexes every file matching a given pattern beneath a given
+    directory. Files whose size and modification time (or failing that, hash)
+    are unchanged since they were last indexed are skipped, and files matching
+    the pattern that no longer exist are removed from the catalog (files that
+    were indexed with another pattern are left alone).
+
+    Returns:
+      A tuple of a list of the paths that were (re)indexed and a list of the
+      paths that could not be read as OpenMotorsport files.
+    '''
+    indexed, failed, found = [], [], set()
+    for root, dirs, files in os.walk(directory):
+      for name in fnmatch.filter(files, pattern):
+        path = os.path.abspath(os.path.join(root, name))
+        found.add(path)
+        try:
+          if self.add(path):
+            indexed.append(path)
+        except Exception:
+          failed.append(path)
+
+    prefix = os.path.join(os.path.abspath(directory), '')
+    for id, path in self._db.execute('SELECT id, path FROM sessions').fetchall():
+      if path.startswith(prefix) and path not in found and \
+         fnmatch.fnmatch(os.path.basename(path), pattern):
+        self._delete(id)
+    self._db.commit()
+    return indexed, failed
+
+  def add(self, filepath):
+    '''
+    Indexes a single file unless it is unchanged since it was last indexed.
+    Returns True if the file was (re)indexed.
+
+    Raises an Exception if the file cannot be read.
+    '''
+    path = os.path.abspath(filepath)
+    st = os.stat(path)
+    row = self._db.execute(
+      'SELECT id, mtime, size, hash FROM sessions WHERE path = ?', (path,)
+    ).fetchone()
+    if row and row[1] == st.st_mtime and row[2] == st.st_size:
+      return False
+
+    digest = file_hash(path)
+    if row and row[3] == digest:
+      self._db.execute('UPDATE sessions SET mtime = ?, size = ? WHERE id = ?',
+                       (st.st_mtime, st.st_size, row[0]))
+      self._db.commit()
+      return False
+
+    session = Session(path)
+    try:
+      if row:
+        self._delete(row[0])
+      self._insert(session, path, st, digest)
+      self._db.commit()
+    except:
+      self._db.rollback()
+      raise
+    finally:
+      session.close()
+    return True
+
+  def sessions(self, channel=None, date_from=None, date_to=None, **criteria):
+    '''
+    Gets the paths of the sessions that match given criteria, ordered by date.
+
+    Args:
+      channel
+        Only sessions with a channel of this name. [optional]
+      date_from, date_to
+        Only sessions on or after (before) a given datetime. [optional]
+      criteria
+        Any of CRITERIA, which must match exactly (e.g. venue='Silverstone').
+        [optional]
+    '''
+    where, args = self._where(channel, date_from, date_to, criteria)
+    query = 'SELECT path FROM sessions s WHERE %s ORDER BY date, path' % where
+    return [row[0] for row in self._db.execute(query, args)]
+
+  def laps(self, min_length=None, max_length=None, incomplete=False,
+           channel=None, date_from=None, date_to=None, **criteria):
+    '''
+    Gets the laps of the sessions that match given criteria (see
+    Catalog.sessions) as a list of (path, lap index, length) tuples, ordered
+    by lap length.
+
+    Args:
+      min_length, max_length
+        Only laps at least (at most) this long. [optional]
+      incomplete
+        Include incomplete laps. [optional]
+    '''
+    where, args = self._where(channel, date_from, date_to, criteria)
+    if min_length is not None:
+      where += ' AND l.length >= ?'
+      args.append(min_length)
+    if max_length is not None:
+      where += ' AND l.length <= ?'
+      args.append(max_length)
+    if not incomplete:
+      where += ' AND NOT l.incomplete'
+    query = 'SELECT s.path, l.lap, l.length FROM sessions s ' \
+            'JOIN laps l ON l.session_id = s.id WHERE %s ' \
+            'ORDER BY l.length, s.path, l.lap' % where
+    return [tuple(row) for row in self._db.execute(query, args)]
+
+  def sectors(self, path, lap):
+    '''Gets the list of sector times of a given lap of an indexed session.'''
+    query = 'SELECT t.time FROM sectors t JOIN sessions s ON t.session_id = ' \
+            's.id WHERE s.path = ? AND t.lap = ? ORDER BY t.sector'
+    return [row[0] for row in
+            self._db.execute(query, (os.path.abspath(path), lap))]
+
+  def channels(self, path):
+    '''
+    Gets the channels of an indexed session as a list of (id, name, group,
+    units, interval) tuples, where interval is None for variable rate channels.
+    '''
+    query = 'SELECT c.channel_id, c.name, c.group_name, c.units, c.interval ' \
+            'FROM channels c JOIN sessions s ON c.session_id = s.id ' \
+            'WHERE s.path = ? ORDER BY c.channel_id'
+    return [tuple(row) for row in
+            self._db.execute(query, (os.path.abspath(path),))]
+
+  def _where(self, channel, date_from, date_to, criteria):
+    '''Private method. Builds the WHERE clause (and arguments) of a query.'''
+    clauses, args = ['1'], []
+    for key, value in sorted(criteria.items()):
+      if key not in CRITERIA:
+        raise TypeError('Unknown criteria %s' % key)
+      clauses.append('s.%s = ?' % key)
+      args.append(value)
+    if channel is not None:
+      clauses.append('EXISTS (SELECT 1 FROM channels c WHERE ' \
+                     'c.session_id = s.id AND c.name = ?)')
+      args.append(channel)
+    if date_from is not None:
+      clauses.append('s.date >= ?')
+      args.append(to_iso8601_date(date_from))
+    if date_to is not None:
+      clauses.append('s.date <= ?')
+      args.append(to_iso8601_date(date_to))
+    return ' AND '.join(clauses), args
+
+  def _insert(self, session, path, st, digest):
+    '''Private method. Inserts the rows of a given session.'''
+    metadata = session.metadata
+    cursor = self._db.execute(
+      'INSERT INTO sessions (path, mtime, size, hash, user, venue, ' \
+      'configuration, vehicle, year, category, date, duration, datasource, ' \
+      'comments, num_sectors) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ' \
+      '?, ?)',
+      (path, st.st_mtime, st.st_size, digest, metadata.user,
+       metadata.venue.get('name'), metadata.venue.get('configuration'),
+       metadata.vehicle.get('name'), metadata.vehicle.get('year'),
+       metadata.vehicle.get('category'), to_iso8601_date(metadata.date),
+       metadata.duration, metadata.datasource, metadata.comments,
+       session.num_sectors)
+    )
+    id = cursor.lastrowid
+
+    self._db.executemany(
+      'INSERT INTO channels VALUES (?, ?, ?, ?, ?, ?)',
+      [(id, c.id, c.name, c.group, c.units,
+        c.timeseries.frequency.interval
+        if hasattr(c.timeseries, 'frequency') else None)
+       for c in session.channels]
+    )
+    for index, lap in enumerate(session.laps):
+      self._db.execute('INSERT INTO laps VALUES (?, ?, ?, ?, ?)',
+                       (id, index, _float(lap.offset), _float(lap.length),
+                        int(lap.incomplete)))
+      self._db.executemany('INSERT INTO sectors VALUES (?, ?, ?, ?)',
+                           [(id, index, sector, _float(time))
+                            for sector, time in enumerate(lap.sectors)])
+
+  def _delete(self, id):
+    '''Private method. Deletes the rows of a given session.'''
+    for table in ('channels', 'laps', 'sectors'):
+      self._db.execute('DELETE FROM %s WHERE session_id = ?' % table, (id,))
+    self._db.execute('DELETE FROM sessions WHERE id = ?', (id,))
+
+def file_hash(filepath):
+  '''Gets the SHA-1 hex digest of a given file.'''
+  digest = hashlib.sha1()
+  f = open(filepath, 'rb')
+  try:
+    for chunk in iter(lambda: f.read(1 << 20), ''):
+      digest.update(chunk)
+  finally:
+    f.close()
+  return digest.hexdigest()
+
+def _float(value):
+  '''Converts numpy scalars (which sqlite3 cannot bind) to float or None.'''
+  return None if value is None else float(value)
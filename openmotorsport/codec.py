@@ -0,0 +1,316 @@
+#!/usr/bin/python2.6
+#
+# Codecs for the binary channel entries of an OpenMotorsport archive.
+#
+# Author: Martin Galpin (m@66laps.com)
+#
+# Copyright 2007 66laps Limited. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bz2, zipfile, zlib
+import numpy as np
+
+try:
+  import lzma
+except ImportError:
+  try:
+    from backports import lzma
+  except ImportError:
+    lzma = None
+
+class Codec(object):
+  '''
+  This class represents the encoding of a binary channel entry. A codec is
+  described by a string of comma separated filters followed by a compressor
+  (with an optional level), for example:
+
+  >>> Codec('delta,deflate:9')
+  delta,deflate:9
+  >>> Codec('shuffle,bz2')
+  shuffle,bz2
+
+  The filters are:
+
+  'delta': stores the difference between consecutive samples (integers only).
+  'delta2': stores the difference between consecutive deltas (integers only).
+  'shuffle': groups the n-th byte of every sample together.
+
+  The compressors are:
+
+  'deflate': the archive entry is deflated by the zip format itself (the
+    default, and the only compressor understood by other zip tools).
+  'bz2': bzip2 compression (the archive entry itself is stored).
+  'lzma': LZMA compression (requires the lzma module, which is part of the
+    standard library from Python 3.3 and otherwise backports.lzma).
+  'none': the archive entry is stored without compression.
+  '''
+
+  def __init__(self, spec='deflate'):
+    '''
+    Creates a new instance of Codec from a given description.
+
+    Raises ValueError if a filter or compressor is unknown (or unavailable).
+    '''
+    names = [name.strip() for name in spec.split(',') if name.strip()]
+    if not names or names[-1].partition(':')[0] in FILTERS:
+      names.append('deflate')
+
+    self._filters = names[:-1]
+    for name in self._filters:
+      if name not in FILTERS:
+        raise ValueError('Unknown filter %s' % name)
+
+    self._compressor, _, level = names[-1].partition(':')
+    if self._compressor not in COMPRESSORS:
+      raise ValueError('Unknown compressor %s' % self._compressor)
+    if self._compressor == 'lzma' and lzma is None:
+      raise ValueError('LZMA compression requires the lzma module')
+    self._level = int(level) if level else COMPRESSORS[self._compressor]
+
+  @property
+  def filters(self):
+    '''Gets the list of filter names, in the order they are applied.'''
+    return self._filters
+
+  @property
+  def compressor(self):
+    '''Gets the name of the compressor.'''
+    return self._compressor
+
+  @property
+  def level(self):
+    '''Gets the compression level (or preset) of the compressor.'''
+    return self._level
+
+  @property
+  def compress_type(self):
+    '''Gets the zipfile compression type of an entry using this codec.'''
+    if self._compressor == 'deflate':
+      return zipfile.ZIP_DEFLATED
+    return zipfile.ZIP_STORED
+
+  @property
+  def is_raw(self):
+    '''Gets whether the entry (once inflated by zipfile) is the raw array.'''
+    return not self._filters and self._compressor in ('deflate', 'none')
+
+  @property
+  def is_streamable(self):
+    '''
+    Gets whether an array can be encoded in chunks (see encoder), which is
+    the case unless it is shuffled (which groups bytes across the array).
+    '''
+    return 'shuffle' not in self._filters
+
+  def encoder(self):
+    '''
+    Gets a new Encoder to encode an array with this codec in chunks.
+
+    Raises ValueError if this codec is not streamable.
+    '''
+    return Encoder(self)
+
+  def encode(self, array):
+    '''
+    Encodes an array with the filters and compressor of this codec (although
+    deflate compression is left to the archive). Returns an array of the
+    entry's bytes (or the array itself if the codec is raw).
+    '''
+    array = np.ascontiguousarray(array)
+    for name in self._filters:
+      array = FILTERS[name][0](array)
+    if self._compressor == 'bz2':
+      array = np.frombuffer(bz2.compress(array.tostring(), self._level),
+                            dtype=np.uint8)
+    elif self._compressor == 'lzma':
+      array = np.frombuffer(lzma.compress(array.tostring(), preset=self._level),
+                            dtype=np.uint8)
+    return array
+
+  def decode(self, raw, dtype):
+    '''Decodes the bytes of an entry (a uint8 array) to an array of dtype.'''
+    if self._compressor == 'bz2':
+      raw = np.frombuffer(bz2.decompress(raw.tostring()), dtype=np.uint8)
+    elif self._compressor == 'lzma':
+      raw = np.frombuffer(lzma.decompress(raw.tostring()), dtype=np.uint8)
+
+    # the dtype of the input to each filter, in order
+    dtypes = [np.dtype(dtype)]
+    for name in self._filters:
+      dtypes.append(np.dtype(np.uint8) if name == 'shuffle' else dtypes[-1])
+
+    array = raw.view(dtypes[-1])
+    for name, input_dtype in reversed(zip(self._filters, dtypes)):
+      array = FILTERS[name][1](array, input_dtype)
+    return array if array.flags.writeable else array.copy()
+
+  def __repr__(self):
+    compressor = self._compressor
+    if self._level != COMPRESSORS[compressor]:
+      compressor = '%s:%d' % (compressor, self._level)
+    return ','.join(self._filters + [compressor])
+
+  def __eq__(self, other):
+    return isinstance(other, Codec) and repr(self) == repr(other)
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+class Encoder(object):
+  '''
+  An incremental encoder of a Codec, which encodes an array in consecutive
+  chunks (so the whole array never needs to be in memory). The filters carry
+  their state from one chunk to the next, so the concatenated output is the
+  same as Codec.encode of the whole array. For example:
+
+  >>> encoder = Codec('delta,bz2').encoder()
+  >>> entry = ''.join([encoder.encode(chunk) for chunk in chunks])
+  >>> entry += encoder.flush()
+  '''
+
+  def __init__(self, codec):
+    '''
+    Creates a new instance of Encoder for a given Codec.
+
+    Raises ValueError if the codec is not streamable.
+    '''
+    if not codec.is_streamable:
+      raise ValueError('Codec %r cannot be encoded in chunks' % codec)
+    self._filters = []
+    for name in codec.filters:
+      # delta2 is a delta of the deltas
+      for i in range(2 if name == 'delta2' else 1):
+        self._filters.append(_DeltaEncoder())
+    if codec.compressor == 'bz2':
+      self._compressor = bz2.BZ2Compressor(codec.level)
+    elif codec.compressor == 'lzma':
+      self._compressor = lzma.LZMACompressor(preset=codec.level)
+    else:
+      self._compressor = None
+
+  def encode(self, array):
+    '''Encodes the next chunk of an array, returning a string of bytes.'''
+    array = np.ascontiguousarray(array)
+    for encoder in self._filters:
+      array = encoder.encode(array)
+    if self._compressor is None:
+      return array.tostring()
+    return self._compressor.compress(array.tostring())
+
+  def flush(self):
+    '''Gets the remaining bytes of the entry, once every chunk is encoded.'''
+    if self._compressor is None:
+      return ''
+    return self._compressor.flush()
+
+class _DeltaEncoder(object):
+  '''Private class. A delta filter that carries the last sample between
+  chunks.'''
+
+  def __init__(self):
+    self._last = None
+
+  def encode(self, array):
+    if self._last is None or array.dtype.kind not in 'iu':
+      deltas = _delta_encode(array)
+    else:
+      deltas = np.empty_like(array)
+      np.subtract(array[:1], self._last, deltas[:1])
+      np.subtract(array[1:], array[:-1], deltas[1:])
+    if len(array):
+      self._last = array[-1:].copy()
+    return deltas
+
+def _delta_encode(array):
+  if array.dtype.kind not in 'iu':
+    raise ValueError('Delta encoding requires an integer array')
+  deltas = np.empty_like(array)
+  deltas[:1] = array[:1]
+  np.subtract(array[1:], array[:-1], deltas[1:])
+  return deltas
+
+def _delta_decode(array, dtype):
+  return np.cumsum(array, dtype=dtype)
+
+def _delta2_encode(array):
+  return _delta_encode(_delta_encode(array))
+
+def _delta2_decode(array, dtype):
+  return _delta_decode(_delta_decode(array, dtype), dtype)
+
+def _shuffle(array):
+  itemsize = array.dtype.itemsize
+  return array.view(np.uint8).reshape((-1, itemsize)).T.ravel()
+
+def _unshuffle(array, dtype):
+  return array.reshape((dtype.itemsize, -1)).T.copy().view(dtype).ravel()
+
+FILTERS = {
+  'delta': (_delta_encode, _delta_decode),
+  'delta2': (_delta2_encode, _delta2_decode),
+  'shuffle': (_shuffle, _unshuffle)
+}
+'''The filters of a codec, as (encode, decode) function pairs.'''
+
+COMPRESSORS = {
+  'deflate': zlib.Z_DEFAULT_COMPRESSION,
+  'bz2': 9,
+  'lzma': 6,
+  'none': 0
+}
+'''The compressors of a codec, with their default level.'''
+
+def as_codec(value):
+  '''Gets an instance of Codec from a description, Codec instance or None.'''
+  if value is None or isinstance(value, Codec):
+    return value
+  return Codec(value)
+
+STORAGE_DTYPES = ('int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32',
+                  'float16', 'float32', 'float64')
+'''The dtypes that channel data may be stored as.'''
+
+def to_storage(data, dtype, scale=None, add_offset=None):
+  '''
+  Converts an array of channel values to a given storage dtype, where the
+  stored value is (value - add_offset) / scale. Values stored as integers are
+  rounded and clipped to the range of the dtype.
+  '''
+  data, dtype = np.asarray(data), np.dtype(dtype)
+  if data.dtype == dtype and scale is None and not add_offset:
+    return data
+  if add_offset:
+    data = data - add_offset
+  if scale is not None:
+    data = data / float(scale)
+  if dtype.kind in 'iu':
+    info = np.iinfo(dtype)
+    data = np.clip(np.round(data), info.min, info.max)
+  return data.astype(dtype)
+
+def from_storage(array, scale=None, add_offset=None):
+  '''
+  Converts an array of stored channel data to values (see to_storage). The
+  values are float32, unless the array is stored as float64 or 32-bit
+  integers, in which case they are float64.
+  '''
+  dtype = np.promote_types(array.dtype, np.float32)
+  if array.dtype == dtype and scale is None and not add_offset:
+    return array
+  data = array.astype(dtype)
+  if scale is not None:
+    data *= scale
+  if add_offset:
+    data += add_offset
+  return data
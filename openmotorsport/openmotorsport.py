@@ -24,26 +24,38 @@ __version__ = '1.0b'
 __license__ = 'Apache License, Version 2.0'
 
 import datetime
-import  os, sys, tempfile, zipfile
-import itertools
+import  mmap, os, sys, shutil, tempfile, zipfile, zlib
+import itertools, multiprocessing, threading, Queue
 import xml.etree.ElementTree as ET
+from multiprocessing.pool import ThreadPool
 import numpy as np
 
 from utils import *
 from time import *
+from archive import *
+from codec import Codec, as_codec, to_storage, from_storage, STORAGE_DTYPES
+from cache import CACHE
 
 class Session(object):
   '''An instance of openmotorsport.Session represents a OpenMotorsport file.'''
 
-  def __init__(self, filepath=None, **kwargs):
+  def __init__(self, filepath=None, metadata_only=False, channel_ids=None,
+               **kwargs):
     '''
     Create a new instance of openmotorsport.Session. Either constructs a
     brand new instance that is empty or loads an existing file.
 
     Args:
       filepath
-        The path to an existing OpenMotorsport session to load. [optional]
-
+        The path to an existing OpenMotorsport session to load, or a
+        seekable binary file-like object (e.g. a StringIO or an mmap.mmap)
+        to load it from in memory. [optional]
+      metadata_only
+        Only load the metadata and markers of an existing session (see
+        Session.open_header). [optional]
+      channel_ids
+        Only load the channels of an existing session with these
+        identifiers. [optional]
     '''
     self.metadata = Metadata()
     self._channels = {}
@@ -51,14 +63,47 @@ class Session(object):
     self._group_descriptions = {}
     self._channels_ids = {}
     self.markers = np.array([], dtype=np.uint32)
+    self._markers_buffer = None
     self.num_sectors = None
     self._laps = []
+    self._filepath = None
+    self._zipfile = None
+    self._blocks = {}
+    self._indices = {}
+    self._codecs = {}
+    self._envelopes = {}
+    self._storage = {}
+    self._lock = threading.RLock()
 
     if filepath:
-      self._load(filepath)
+      self._load(filepath, metadata_only, channel_ids)
 
     self.__dict__.update(**kwargs)
 
+  @staticmethod
+  def open_header(filepath):
+    '''
+    A convenience method to load only the metadata and markers (and so laps)
+    of an existing OpenMotorsport file. meta.xml is parsed incrementally and
+    parsing stops as soon as both have been read, no channels are created and
+    the file is closed before returning. This is much faster than loading a
+    session when cataloguing many files.
+    '''
+    return Session(filepath, metadata_only=True)
+
+  @staticmethod
+  def aopen(filepath, loop=None, **kwargs):
+    '''
+    Loads an existing OpenMotorsport file on the shared thread pool of the
+    aio module, returning an asyncio future of the Session (so that it can
+    be awaited without blocking an event loop). Other arguments are as
+    Session.
+
+    Raises ImportError if asyncio is not available.
+    '''
+    from aio import run
+    return run(Session, filepath, loop=loop, **kwargs)
+
   @property
   def channels(self):
     '''Gets a list of Channel instances for this session.'''
@@ -80,11 +125,23 @@ class Session(object):
 
   def close(self):
     '''Close any open resources.'''
-    self._zipfile.close()
+    if self._zipfile is not None:
+      self._zipfile.close()
 
   def add_marker(self, marker):
     '''Adds a markers to the current session.'''
-    self.markers = np.append(self.markers, marker)
+    self.add_markers(marker)
+
+  def add_markers(self, markers):
+    '''
+    Adds an array of markers to the current session, in amortised constant
+    time per marker (see time.extend_buffer).
+    '''
+    markers = np.asanyarray(markers)
+    if not markers.size:
+      return
+    self.markers, self._markers_buffer = extend_buffer(self.markers,
+      self._markers_buffer, markers, np.result_type(self.markers, markers))
 
   def add_channel(self, channel):
     '''Adds a given instance of Channel to this session.'''
@@ -137,40 +194,415 @@ class Session(object):
   '''A list of openmotorsport.Lap instances for this session. Laps are
   calculated based on the number of the markers and sectors per lap.'''
 
-  def write(self, filepath):
-    '''Write this instance to an OpenMotorsport file and returns the filepath.'''
-    def write_binary(array, zipfile, arcname):
-      tup = tempfile.mkstemp()
-      array.tofile(os.fdopen(tup[0], "wb"))
-      zipfile.write(tup[1], arcname=arcname)
-      os.remove(tup[1])
+  def write(self, filepath, compression=zipfile.ZIP_DEFLATED, workers=None,
+            block_size=None, codec=None, times_codec=None, envelopes=False):
+    '''
+    Write this instance to an OpenMotorsport file and returns the filepath.
 
-    try:
-      self._zipfile = zipfile.ZipFile(filepath, 'w', zipfile.ZIP_DEFLATED)
-      self._zipfile.writestr('meta.xml', self._write_meta())
+    Args:
+      filepath
+        The path of the OpenMotorsport file to write, or a writable binary
+        stream to write it to (which need not be seekable).
+      compression
+        The compression method of the archive entries, either
+        zipfile.ZIP_DEFLATED (the default) or zipfile.ZIP_STORED. Channels of
+        a stored archive are memory-mapped rather than decoded when loaded.
+        [optional]
+      workers
+        The number of threads used to deflate channels concurrently. The
+        deflated entries are written to the archive in order as each batch of
+        `workers` channels completes. Defaults to deflating serially.
+        [optional]
+      block_size
+        When given, each channel is stored as blocks of this many samples
+        together with an index of the sample offset and start time of each
+        block, so that slicing a loaded channel only decodes the blocks that
+        overlap the slice. Defaults to storing each channel as a single
+        entry. [optional]
+      codec
+        The codec.Codec (or its description, e.g. 'shuffle,deflate:9') of the
+        data of channels that do not specify their own. Defaults to the
+        archive compression. [optional]
+      times_codec
+        The codec.Codec (or its description, e.g. 'delta,deflate') of the
+        times of variable rate channels that do not specify their own.
+        Defaults to the archive compression. [optional]
+      envelopes
+        Also store the time.Envelope (min/max pyramid) of each channel, so
+        that loaded channels can be plotted at any zoom level without
+        decoding their data. [optional]
+    '''
+    codec, times_codec = as_codec(codec), as_codec(times_codec)
 
-      for c in self.channels:
-        write_binary(c.timeseries.data, self._zipfile, 'data/%s.bin' % c.id)
-        if not hasattr(c.timeseries, "frequency"):
-          write_binary(c.timeseries.times, self._zipfile, 'data/%s.tms' % c.id)
+    def encode(entry):
+      arcname, array, entry_codec = entry
+      if entry_codec is None:
+        return arcname, array, compression, zlib.Z_DEFAULT_COMPRESSION
+      return (arcname, entry_codec.encode(array), entry_codec.compress_type,
+              entry_codec.level)
 
-      self._zipfile.close()
+    def deflate(entry):
+      arcname, array, compress_type, level = encode(entry)
+      if compress_type == zipfile.ZIP_DEFLATED:
+        return arcname, None, deflate_array(array, level)
+      return arcname, array, None
+
+    target = filepath
+    if not isinstance(filepath, basestring) and not is_seekable(filepath):
+      target = UnseekableStream(filepath)
+
+    try:
+      archive = zipfile.ZipFile(target, 'w', compression, allowZip64=True)
+      archive.writestr('meta.xml', self._write_meta(block_size, codec,
+                                                    times_codec, envelopes))
+
+      # NB: the entries of each channel are generated (and so its data read)
+      # only as they are written, so at most one channel (or one batch of
+      # `workers` channels) is held in memory at a time
+      channels = self.channels
+      if workers and workers > 1:
+        pool = ThreadPool(workers)
+        try:
+          for i in xrange(0, len(channels), workers):
+            entries = []
+            for c in channels[i:i + workers]:
+              entries.extend(self._channel_entries(c, block_size, codec,
+                                                   times_codec, envelopes))
+            for arcname, array, deflated in pool.map(deflate, entries):
+              if deflated is None:
+                write_array(archive, arcname, array, zipfile.ZIP_STORED)
+              else:
+                write_deflated(archive, arcname, *deflated)
+            del entries
+        finally:
+          pool.close()
+          pool.join()
+      else:
+        for c in channels:
+          for entry in self._channel_entries(c, block_size, codec,
+                                             times_codec, envelopes):
+            write_array(archive, *encode(entry))
+
+      archive.close()
       return filepath
     except:
       # delete a partial file on error
-      os.remove(filepath)
+      if isinstance(filepath, basestring):
+        os.remove(filepath)
       raise
 
-  def _read_channel_data(self, channel_id):
-    p = 'data/%s.bin' % channel_id
-    return np.fromfile(self._zipfile.extract(p, self._tempdir), dtype=np.float32)
+  def _channel_entries(self, channel, block_size=None, codec=None,
+                       times_codec=None, envelopes=False):
+    '''
+    Gets an iterator of the (arcname, array, codec) archive entries of a given
+    channel, where the codec is None for entries that use the archive
+    compression. The channel's data is only read once the first entry is
+    needed.
+    '''
+    timeseries = channel.timeseries
+    variable = not hasattr(timeseries, "frequency")
+    codec = channel.codec or codec
+    times_codec = channel.times_codec or times_codec
+    data = channel.to_storage(timeseries.data)
+    if not block_size:
+      yield ('data/%s.bin' % channel.id, data, codec)
+      if variable:
+        yield ('data/%s.tms' % channel.id, timeseries.times, times_codec)
+    else:
+      offsets = np.arange(0, len(timeseries), block_size)
+      if variable:
+        starts = timeseries.times[offsets]
+      else:
+        starts = timeseries.offset + offsets * timeseries.frequency.interval
+      index = np.column_stack((offsets, starts)).astype(np.uint64)
+
+      yield ('data/%s.idx' % channel.id, index, None)
+      for k, offset in enumerate(offsets):
+        yield ('data/%s/%d.bin' % (channel.id, k),
+               data[offset:offset + block_size], codec)
+        if variable:
+          yield ('data/%s/%d.tms' % (channel.id, k),
+                 timeseries.times[offset:offset + block_size], times_codec)
+
+    if envelopes and len(timeseries):
+      yield ('data/%s.env' % channel.id, timeseries.pyramid.to_array(), None)
+
+  def slice(self, epoch, channel_ids=None):
+    '''
+    Gets the time series of many channels sliced to a given epoch (for
+    example, an instance of Lap). Channels that were written in blocks (see
+    Session.write) only decode the blocks that overlap the epoch.
+
+    Args:
+      epoch
+        An instance of time.Epoch.
+      channel_ids
+        A list of channel identifiers to slice. Defaults to every channel.
+        [optional]
 
-  def _read_channel_times(self, channel_id):
+    Returns:
+      A dict of sliced time series keyed by channel identifier.
+
+    Raises KeyError if a given channel identifier does not exist.
+    '''
+    if channel_ids is None:
+      channels = self.channels
+    else:
+      channels = [self._channels_ids[str(id)] for id in channel_ids]
+    return dict([(c.id, c.timeseries.slice(epoch)) for c in channels])
+
+  def to_matrix(self, channel_ids=None, frequency=None, times=None, epoch=None,
+                out=None):
+    '''
+    Gets the data of many channels aligned onto one time grid, as a single 2D
+    array with a row per time and a column per channel. Each column is
+    interpolated from its channel's data in one vectorised pass (see
+    time.interpolate_at) and times outside of a channel are NaN.
+
+    Args:
+      channel_ids
+        A list of the channel identifiers of the columns. Defaults to every
+        channel, in order of identifier. [optional]
+      frequency
+        An instance of time.Frequency of a uniform grid, from the offset of a
+        given epoch or otherwise from the first sample of any of the channels
+        to the last. [optional]
+      times
+        An array of the times of the grid (instead of a frequency). [optional]
+      epoch
+        An instance of time.Epoch (for example, an instance of Lap) to limit
+        a uniform grid to. [optional]
+      out
+        An array of the right shape to write the matrix to (e.g. a
+        numpy.memmap) rather than allocating a new float64 array. [optional]
+
+    Returns:
+      A tuple of the array of the times of the grid and the matrix.
+
+    Raises KeyError if a given channel identifier does not exist or
+    ValueError if neither a frequency or times are given, or out is not of
+    the right shape.
+    '''
+    if channel_ids is None:
+      channel_ids = sorted([c.id for c in self.channels])
+    channels = [self._channels_ids[str(id)] for id in channel_ids]
+
+    if times is not None:
+      times = np.asarray(times, dtype=np.float64)
+    elif frequency is None:
+      raise ValueError('Either a frequency or times must be given.')
+    else:
+      interval = frequency.interval
+      if epoch is not None:
+        start = epoch.offset
+        count = max(int(np.ceil(float(epoch.length) / interval)), 0)
+      else:
+        summaries = [c.timeseries.summary for c in channels]
+        summaries = [s for s in summaries if s.count]
+        start = min([s.first_time for s in summaries] or [0])
+        end = max([s.last_time for s in summaries] or [start - interval])
+        count = int((end - start) // interval) + 1
+      times = start + np.arange(count) * float(interval)
+
+    shape = (len(times), len(channels))
+    if out is None:
+      out = np.empty(shape)
+    elif out.shape != shape:
+      raise ValueError('The output must be of shape %r.' % (shape,))
+
+    for column, channel in enumerate(channels):
+      timeseries = channel.timeseries
+      interpolate_at(timeseries.data, timeseries.positions_at(times),
+                     fill=np.nan, out=out[:, column])
+    return times, out
+
+  def preload(self, channel_ids=None, workers=None):
+    '''
+    Loads the data (and times) of many channels concurrently on a pool of
+    worker threads. zlib releases the GIL whilst inflating, so each worker
+    decodes on its own core, reading from its own handle to the archive. The
+    lazy time series of each channel are filled in place. A session loaded
+    from a file-like object cannot be reopened, so its workers share its own
+    handle (and inflate one at a time).
+
+    Args:
+      channel_ids
+        A list of channel identifiers to load. Defaults to every channel.
+        [optional]
+      workers
+        The number of worker threads. Defaults to the number of CPUs.
+        [optional]
+
+    Raises KeyError if a given channel identifier does not exist.
+    '''
+    if channel_ids is None:
+      channels = self.channels
+    else:
+      channels = [self._channels_ids[str(id)] for id in channel_ids]
+
+    pending = Queue.Queue()
+    for channel in channels:
+      if hasattr(channel.timeseries, 'load'):
+        pending.put(channel.timeseries)
+
+    errors = []
+    def worker():
+      archive = None
+      if isinstance(self._filepath, basestring):
+        archive = zipfile.ZipFile(self._filepath, 'r')
+      try:
+        while True:
+          try:
+            timeseries = pending.get_nowait()
+          except Queue.Empty:
+            return
+          timeseries.load(archive)
+      except Exception:
+        errors.append(sys.exc_info())
+      finally:
+        if archive is not None:
+          archive.close()
+
+    workers = min(workers or multiprocessing.cpu_count(), pending.qsize())
+    threads = [threading.Thread(target=worker) for i in xrange(0, workers)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+
+    if errors:
+      raise errors[0][0], errors[0][1], errors[0][2]
+
+  def _read_channel_data(self, channel_id, archive=None, raw=False):
+    '''
+    Reads the data of a channel, converted from its storage dtype to values
+    unless raw is True.
+    '''
+    dtype = self._channel_dtype(channel_id)
+    if channel_id in self._blocks:
+      data = self._read_channel_blocks(channel_id, 'bin', dtype, 0,
+                                       self._blocks[channel_id], archive)
+    else:
+      p = 'data/%s.bin' % channel_id
+      data = self._read_array(p, dtype, archive,
+                              self._codecs.get((channel_id, 'bin')))
+    return data if raw else self._channel_values(channel_id, data)
+
+  def _channel_dtype(self, channel_id):
+    '''Gets the storage dtype of the data of a channel.'''
+    if channel_id in self._storage:
+      return self._storage[channel_id][0]
+    return np.dtype(np.float32)
+
+  def _channel_values(self, channel_id, data):
+    '''Converts the stored data of a channel to values.'''
+    if channel_id not in self._storage:
+      return data
+    dtype, scale, add_offset = self._storage[channel_id]
+    return from_storage(data, scale, add_offset)
+
+  def _read_channel_times(self, channel_id, archive=None):
+    if channel_id in self._blocks:
+      return self._read_channel_blocks(channel_id, 'tms', np.uint32, 0,
+                                       self._blocks[channel_id], archive)
     p = 'data/%s.tms' % channel_id
-    return np.fromfile(self._zipfile.extract(p, self._tempdir), dtype=np.uint32)
+    return self._read_array(p, np.uint32, archive,
+                            self._codecs.get((channel_id, 'tms')))
+
+  def _read_channel_index(self, channel_id):
+    '''
+    Gets the block index of a channel as an array of (sample offset, start
+    time) rows, or None if the channel was not written in blocks.
+    '''
+    if channel_id not in self._blocks:
+      return None
+    if channel_id not in self._indices:
+      p = 'data/%s.idx' % channel_id
+      self._indices[channel_id] = \
+        self._read_array(p, np.uint64).reshape((-1, 2))
+    return self._indices[channel_id]
 
-  def _write_meta(self):
-    '''Generate the meta.xml file and return the contents as a string.'''
+  def _read_channel_samples(self, channel_id, start, end):
+    '''
+    Reads the values of the samples [start, end) of a channel that was
+    written in blocks, reading only the blocks that hold them.
+    '''
+    offsets = self._read_channel_index(channel_id)[:, 0].astype(np.int64)
+    first = max(np.searchsorted(offsets, start, 'right') - 1, 0)
+    last = max(np.searchsorted(offsets, end, 'left'), first)
+    data = self._read_channel_blocks(channel_id, 'bin',
+                                     self._channel_dtype(channel_id),
+                                     first, last)
+    base = int(offsets[first]) if len(offsets) else 0
+    return self._channel_values(channel_id, data)[start - base:end - base]
+
+  def _read_channel_envelope(self, channel_id):
+    '''
+    Gets the stored time.Envelope of a channel, or None if the channel was
+    not written with an envelope.
+    '''
+    if channel_id not in self._envelopes:
+      return None
+    p = 'data/%s.env' % channel_id
+    return Envelope.from_array(self._read_array(p, np.float32).reshape((-1, 3)),
+                               self._envelopes[channel_id])
+
+  def _read_channel_blocks(self, channel_id, ext, dtype, first, last,
+                           archive=None):
+    '''Reads the blocks [first, last) of a channel into a single array.'''
+    if archive is None:
+      with self._lock:
+        return self._read_channel_blocks(channel_id, ext, dtype, first, last,
+                                         self._zipfile)
+    names = ['data/%s/%d.%s' % (channel_id, k, ext) for k in xrange(first, last)]
+    codec = self._codecs.get((channel_id, ext))
+    if codec is not None and not codec.is_raw:
+      # the decoded size of each block is only known once it is decoded
+      blocks = [self._read_array(name, dtype, archive, codec) for name in names]
+      return np.concatenate(blocks) if blocks else np.array([], dtype=dtype)
+
+    infos = [archive.getinfo(name) for name in names]
+    itemsize = np.dtype(dtype).itemsize
+    array = np.empty(sum([i.file_size for i in infos]) // itemsize, dtype=dtype)
+
+    offset = 0
+    for name, info in zip(names, infos):
+      out = array[offset:offset + info.file_size // itemsize]
+      block = map_array(archive, self._filepath, name, dtype)
+      if block is None:
+        read_array(archive, name, dtype, out=out)
+      else:
+        out[:] = block
+      offset += len(out)
+    return array
+
+  def _read_array(self, arcname, dtype, archive=None, codec=None):
+    '''
+    Gets an archive entry as an array, memory-mapped where it is stored and
+    decoded where it was written with a codec.Codec. An open handle to the
+    archive may be given (for use from another thread), otherwise the
+    session's own handle is used (by one thread at a time).
+    '''
+    if archive is None:
+      with self._lock:
+        return self._read_array(arcname, dtype, self._zipfile, codec)
+    if codec is not None and not codec.is_raw:
+      return codec.decode(read_array(archive, arcname, np.uint8), dtype)
+    array = map_array(archive, self._filepath, arcname, dtype)
+    if array is None:
+      array = read_array(archive, arcname, dtype)
+    return array
+
+  def _write_meta(self, block_size=None, codec=None, times_codec=None,
+                  envelopes=False, summaries=None, offsets=None):
+    '''
+    Generate the meta.xml file and return the contents as a string. When a
+    block_size is given, the number of blocks of each channel is recorded,
+    and when envelopes is True, the number of samples of each envelope.
+    The codecs of channels that do not specify their own default to the given
+    codec and times_codec. The time.Summary of each channel is recorded from
+    a given dict of summaries keyed by channel identifier, or otherwise from
+    the channel's time series, as is the offset of each uniform channel from a
+    given dict of offsets.
+    '''
     root = ET.Element('openmotorsport')
     root.attrib['xmlns'] = BASE_NS
 
@@ -223,7 +655,29 @@ class Session(object):
       node.attrib['id'] = str(channel.id)
 
       if hasattr(channel.timeseries, "frequency"):
-        node.attrib["interval"] = str(channel.timeseries.frequency.interval)
+        node.attrib["interval"] = repr(channel.timeseries.frequency.interval)
+        if offsets is not None:
+          offset = offsets.get(channel.id, 0)
+        else:
+          offset = channel.timeseries.offset
+        if offset:
+          node.attrib["offset"] = repr(offset)
+      if block_size:
+        blocks = (len(channel.timeseries) + block_size - 1) // block_size
+        node.attrib["blocks"] = str(blocks)
+      if channel.codec or codec:
+        node.attrib["codec"] = repr(channel.codec or codec)
+      if not hasattr(channel.timeseries, "frequency") and \
+         (channel.times_codec or times_codec):
+        node.attrib["times-codec"] = repr(channel.times_codec or times_codec)
+      if envelopes and len(channel.timeseries):
+        node.attrib["envelope"] = str(channel.timeseries.pyramid.size)
+      if channel.storage_dtype != np.float32:
+        node.attrib['dtype'] = channel.storage_dtype.name
+      if channel.scale is not None:
+        node.attrib['scale'] = repr(channel.scale)
+      if channel.add_offset is not None:
+        node.attrib['add-offset'] = repr(channel.add_offset)
       if channel.units:
         node.attrib['units'] = channel.units
 
@@ -231,12 +685,25 @@ class Session(object):
       if channel.description:
         ET.SubElement(node, 'description').text = channel.description
 
-    channels = ET.SubElement(root, 'channels')
-    groups = {}
-    for obj in self.channels:
-      write_channel(channels, groups, obj)
-
-    # markers
+      if summaries is not None:
+        summary = summaries.get(channel.id)
+      else:
+        summary = channel.stored_summary()
+      if summary is not None and summary.count:
+        write_summary(node, summary)
+
+    def write_summary(root, summary):
+      node = ET.SubElement(root, 'summary')
+      node.attrib['count'] = str(summary.count)
+      node.attrib['min'] = repr(summary.min)
+      node.attrib['max'] = repr(summary.max)
+      node.attrib['mean'] = repr(summary.mean)
+      node.attrib['sum-squares'] = repr(summary.sum_squares)
+      # NB: times are fractional when an interval is
+      node.attrib['first-time'] = '%.17g' % summary.first_time
+      node.attrib['last-time'] = '%.17g' % summary.last_time
+
+    # markers (before the channels, so that they can be parsed without them)
     markers = ET.SubElement(root, 'markers')
     if self.num_sectors is not None:
       markers.attrib["sectors"] = str(self.num_sectors)
@@ -245,32 +712,73 @@ class Session(object):
       node = ET.SubElement(markers, 'marker')
       node.attrib["time"] = '%d' % int(marker)
 
+    channels = ET.SubElement(root, 'channels')
+    groups = {}
+    for obj in self.channels:
+      write_channel(channels, groups, obj)
+
     return ET.tostring(root, encoding='UTF-8')
 
-  def _load(self, filepath):
-    '''Read an OpenMotorsport file from a given filepath.'''
-    self._tempdir = tempfile.mkdtemp()
-    self._zipfile = zipfile.ZipFile(filepath, 'r', zipfile.ZIP_DEFLATED)
+  def _load(self, filepath, metadata_only=False, channel_ids=None):
+    '''
+    Read an OpenMotorsport file from a given filepath (or file-like object),
+    optionally only the channels with given identifiers.
+    '''
+    self._filepath = filepath
+    source = filepath
+    if isinstance(filepath, mmap.mmap):
+      source = MappedFile(filepath)
+    self._zipfile = zipfile.ZipFile(source, 'r', zipfile.ZIP_DEFLATED)
 
     try:
-      metafilepath = self._zipfile.extract('meta.xml', self._tempdir)
-      root = ET.parse(metafilepath).getroot()
-      self._parse_meta(root)
-      self._parse_markers(root)
-      self._parse_channels(root)
+      if metadata_only:
+        self._parse_header(self._zipfile.open('meta.xml'))
+      else:
+        root = ET.XML(self._zipfile.read('meta.xml'))
+        self._parse_meta(root)
+        self._parse_markers(root)
+        self._parse_channels(root, channel_ids)
     except Exception, e:
-      raise Exception('Failed to import' + filepath, e), None, sys.exc_info()[2]
+      raise Exception('Failed to import %s' % (filepath,), e), None, \
+        sys.exc_info()[2]
+
+    if metadata_only:
+      self.close()
+      self._zipfile = None
+
+    # otherwise the zipfile is left open (for lazy loading of data)
+
+  def _parse_header(self, stream):
+    '''
+    Parses only meta.xml/metadata and meta.xml/markers from a given file-like
+    object, incrementally, stopping as soon as both have been parsed (which is
+    before the channels, as the markers are written before them).
+    '''
+    remaining = set([ns('metadata'), ns('markers')])
+    for event, node in ET.iterparse(stream):
+      if node.tag == ns('metadata'):
+        self._parse_metadata(node)
+      elif node.tag == ns('markers'):
+        self._parse_marker_nodes(node)
+      else:
+        if node.tag in (ns('channel'), ns('group')):
+          node.clear()
+        continue
 
-    # the zipfile is left open (for lazy loading of data)
+      remaining.discard(node.tag)
+      if not remaining:
+        break
 
   def _parse_meta(self, root):
     '''Parses meta.xml/metadata from a given ElementTree root node.'''
+    self._parse_metadata(root.find(ns('metadata')))
+
+  def _parse_metadata(self, node):
+    '''Parses a given meta.xml/metadata ElementTree node.'''
 
     def read(root, path, dict, key):
       dict[key] = root.findtext('%s/%s' % (ns(path), ns(key)))
 
-    node = root.find(ns('metadata'))
-
     # read user
     self.metadata.user = node.findtext(ns('user'))
 
@@ -299,17 +807,45 @@ class Session(object):
     if duration:
       self.metadata.duration = int(duration)
 
-  def _parse_channels(self, root, group=None):
-    '''Parses meta.xml/channels (and groups) from a given ElementTree root.'''
+  def _parse_channels(self, root, channel_ids=None):
+    '''
+    Parses meta.xml/channels (and groups) from a given ElementTree root,
+    optionally only the channels with given identifiers.
+    '''
+    if channel_ids is not None:
+      channel_ids = set([int(id) for id in channel_ids])
+
     def parse_channel(node, group=None):
       id = int(node.get('id'))
       interval = node.get('interval')
+      if node.get('blocks') is not None:
+        self._blocks[id] = int(node.get('blocks'))
+      codec = as_codec(node.get('codec'))
+      times_codec = as_codec(node.get('times-codec'))
+      if codec is not None:
+        self._codecs[(id, 'bin')] = codec
+      if times_codec is not None:
+        self._codecs[(id, 'tms')] = times_codec
+      if node.get('envelope') is not None:
+        self._envelopes[id] = int(node.get('envelope'))
+      dtype = np.dtype(node.get('dtype', 'float32'))
+      if dtype.name not in STORAGE_DTYPES:
+        raise ValueError('Unsupported storage dtype %s' % dtype)
+      scale, add_offset = node.get('scale'), node.get('add-offset')
+      scale = None if scale is None else float(scale)
+      add_offset = None if add_offset is None else float(add_offset)
+      if dtype != np.float32 or scale is not None or add_offset is not None:
+        self._storage[id] = (dtype, scale, add_offset)
+      summary = parse_summary(node.find(ns('summary')))
       if interval is None:
-        timeseries = LazyVariableTimeSeries(parent=self, channel_id=id)
+        timeseries = LazyVariableTimeSeries(parent=self, channel_id=id,
+                                            summary=summary)
       else:
         timeseries = LazyUniformTimeSeries(
           parent=self, channel_id=id,
-          frequency=Frequency.from_interval(interval)
+          frequency=Frequency.from_interval(interval),
+          offset=parse_time(node.get('offset', '0')),
+          summary=summary
         )
 
       channel = Channel(
@@ -318,15 +854,38 @@ class Session(object):
         timeseries = timeseries,
         units = node.get('units'),
         description = node.findtext(ns('description')),
-        group = group
+        group = group,
+        codec = codec,
+        times_codec = times_codec,
+        dtype = dtype,
+        scale = scale,
+        add_offset = add_offset
       )
       channel.__parent__ = self # a reference to this session for lazy loading
       return channel
 
+    def parse_time(value):
+      value = float(value)
+      return int(value) if value.is_integer() else value
+
+    def parse_summary(node):
+      if node is None:
+        return None
+      return Summary(
+        count = int(node.get('count')),
+        min = float(node.get('min')),
+        max = float(node.get('max')),
+        mean = float(node.get('mean')),
+        sum_squares = float(node.get('sum-squares')),
+        first_time = parse_time(node.get('first-time')),
+        last_time = parse_time(node.get('last-time'))
+      )
+
     def parse_channels(root, group=None):
       for node in root.getchildren():
         if node.tag == ns('channel'):
-          self.add_channel(parse_channel(node, group))
+          if channel_ids is None or int(node.get('id')) in channel_ids:
+            self.add_channel(parse_channel(node, group))
         elif node.tag == ns('group'):
           group = node.findtext(ns('name'))
           description = node.findtext(ns('description'))
@@ -338,12 +897,15 @@ class Session(object):
 
   def _parse_markers(self, root):
     '''Parses meta.xml/markers from a given ElementTree root.'''
-    node = root.find(ns('markers'))
-    if not node:
+    self._parse_marker_nodes(root.find(ns('markers')))
+
+  def _parse_marker_nodes(self, node):
+    '''Parses a given meta.xml/markers ElementTree node (which may be None).'''
+    if node is None:
       return
     self.num_sectors = int(node.get('sectors')) if node.get('sectors') else None
     markers = node.findall(ns('marker'))
-    [self.add_marker(float(x.get('time'))) for x in markers]
+    self.add_markers([float(x.get('time')) for x in markers])
 
 
   def refresh_laps(self):
@@ -446,6 +1008,271 @@ class Session(object):
   def __ne__(self, other):
     return not self.__eq__(other)
 
+class SessionWriter(object):
+  '''
+  Writes an OpenMotorsport file incrementally, for example whilst capturing
+  live telemetry. Samples are appended to each channel in chunks and spooled
+  to disk whenever a channel has buffered `buffer_size` samples, so memory
+  use is bounded regardless of the length of the session. The archive itself
+  (including meta.xml) is written when the writer is closed.
+
+  For example:
+
+  >>> writer = SessionWriter('stint.om', metadata=metadata)
+  >>> writer.add_channel(Channel(id=0, name='Speed',
+  ...   timeseries=UniformTimeSeries(frequency=Frequency(100))))
+  >>> writer.append(0, samples)
+  >>> writer.add_marker(62400)
+  >>> writer.close()
+  '''
+
+  def __init__(self, filepath, metadata=None, num_sectors=None,
+               buffer_size=65536, compression=zipfile.ZIP_DEFLATED):
+    '''
+    Create a new instance of openmotorsport.SessionWriter.
+
+    Args:
+      filepath
+        The path of the OpenMotorsport file to write.
+      metadata
+        An instance of Metadata for the session. [optional]
+      num_sectors
+        The number of sectors per lap (see Session.num_sectors). [optional]
+      buffer_size
+        The number of samples buffered in memory per channel before they are
+        spooled to disk. [optional]
+      compression
+        The compression method of the archive entries (see Session.write).
+        [optional]
+    '''
+    self._filepath = filepath
+    self._buffer_size = buffer_size
+    self._compression = compression
+    self._session = Session(metadata=metadata or Metadata(),
+                            num_sectors=num_sectors)
+    self._spool = tempfile.mkdtemp(
+      dir=os.path.dirname(os.path.abspath(filepath)),
+      prefix='.%s.' % os.path.basename(filepath)
+    )
+    self._end_times = {}
+    self._summaries = {}
+    self._offsets = {}
+
+  @property
+  def session(self):
+    '''Gets the Session (metadata, channels and markers) being written.'''
+    return self._session
+
+  def __enter__(self):
+    '''Context manager protocol. Returns self.'''
+    return self
+
+  def __exit__(self, type, value, traceback):
+    '''Context manager protocol. Writes the file (even on error).'''
+    self.close()
+    return False
+
+  def add_channel(self, channel):
+    '''
+    Adds a given instance of Channel to the session being written. The
+    channel's timeseries (an instance of UniformTimeSeries or
+    VariableTimeSeries) is used as the buffer for appended samples.
+
+    Raises ValueError if the codec of the channel (or its times) cannot be
+    encoded in chunks (see codec.Codec.is_streamable).
+    '''
+    for codec in (channel.codec, channel.times_codec):
+      if codec is not None and not codec.is_streamable:
+        raise ValueError('Codec %r cannot be written incrementally' % codec)
+    self._session.add_channel(channel)
+    self._end_times[channel.id] = channel.timeseries.offset
+    self._offsets[channel.id] = channel.timeseries.offset
+    self._summaries[channel.id] = Summary()
+    if len(channel.timeseries):
+      self._flush_channel(channel)
+
+  def add_marker(self, marker):
+    '''Adds a marker to the session being written.'''
+    self._session.add_marker(marker)
+
+  def append(self, channel_id, data, times=None):
+    '''
+    Appends a chunk of samples to a given channel. `times` must be given
+    (and be of equal length to `data`) for variable rate channels.
+
+    Raises KeyError if the channel has not been added.
+    '''
+    channel = self._session._channels_ids[str(channel_id)]
+    if times is None:
+      channel.timeseries.append(data)
+    else:
+      channel.timeseries.append(data, times)
+    if len(channel.timeseries) >= self._buffer_size:
+      self._flush_channel(channel)
+
+  def flush(self):
+    '''Spools the buffered samples of every channel to disk.'''
+    [self._flush_channel(channel) for channel in self._session.channels]
+
+  def close(self):
+    '''
+    Writes the OpenMotorsport file and removes the spooled samples. The
+    session duration is set from the channels if it has not been given.
+    '''
+    if self._spool is None:
+      return
+    self.flush()
+
+    metadata = self._session.metadata
+    if not metadata.duration and self._end_times:
+      metadata.duration = int(max(self._end_times.values()))
+
+    try:
+      archive = zipfile.ZipFile(self._filepath, 'w', self._compression,
+                                allowZip64=True)
+      archive.writestr('meta.xml',
+                       self._session._write_meta(summaries=self._summaries,
+                                                 offsets=self._offsets))
+      for channel in self._session.channels:
+        self._write_spooled(archive, 'data/%s.bin' % channel.id,
+                            channel.storage_dtype, channel.codec)
+        if not hasattr(channel.timeseries, 'frequency'):
+          self._write_spooled(archive, 'data/%s.tms' % channel.id,
+                              np.uint32, channel.times_codec)
+      archive.close()
+    except:
+      # delete a partial file on error
+      os.remove(self._filepath)
+      raise
+    finally:
+      shutil.rmtree(self._spool, ignore_errors=True)
+      self._spool = None
+
+  def _flush_channel(self, channel):
+    '''Spools the buffered samples of a given channel and empties its buffer.'''
+    timeseries = channel.timeseries
+    if not len(timeseries):
+      return
+
+    stored = channel.to_storage(timeseries.data)
+    self._append_spooled('data/%s.bin' % channel.id, stored)
+    self._summaries[channel.id] = \
+      self._summaries[channel.id].merge(channel.stored_summary(stored))
+    if hasattr(timeseries, 'frequency'):
+      self._end_times[channel.id] = timeseries.end_time
+      channel._timeseries = UniformTimeSeries(frequency=timeseries.frequency,
+                                              offset=timeseries.end_time,
+                                              dtype=timeseries.data.dtype)
+    else:
+      self._append_spooled('data/%s.tms' % channel.id, timeseries.times)
+      self._end_times[channel.id] = timeseries.end_time
+      channel._timeseries = VariableTimeSeries(offset=timeseries.offset,
+                                               dtype=timeseries.data.dtype)
+
+  def _append_spooled(self, arcname, array):
+    f = open(self._spool_path(arcname), 'ab')
+    try:
+      array.tofile(f)
+    finally:
+      f.close()
+
+  def _write_spooled(self, archive, arcname, dtype, codec=None):
+    path = self._spool_path(arcname)
+    if not os.path.exists(path):
+      array = np.array([], dtype=dtype)
+      if codec is None:
+        write_array(archive, arcname, array)
+      else:
+        write_array(archive, arcname, codec.encode(array), codec.compress_type,
+                    codec.level)
+      return
+
+    compress_type, level = None, zlib.Z_DEFAULT_COMPRESSION
+    if codec is not None:
+      compress_type, level = codec.compress_type, codec.level
+    f = open(path, 'rb')
+    try:
+      chunks = iter(lambda: f.read(CHUNK_SIZE), '')
+      if codec is not None and not codec.is_raw:
+        # filters and compressors (other than deflate) are applied a chunk
+        # at a time, so the channel is never read into memory as a whole
+        chunks = self._encode_spooled(chunks, dtype, codec.encoder())
+      write_entry(archive, arcname, chunks, os.path.getsize(path),
+                  compress_type, level)
+    finally:
+      f.close()
+
+  def _encode_spooled(self, chunks, dtype, encoder):
+    '''
+    Private method. Gets an iterator of the encoded chunks of a spooled
+    channel.
+    '''
+    itemsize = np.dtype(dtype).itemsize
+    remainder = ''
+    for chunk in chunks:
+      chunk = remainder + chunk
+      whole = len(chunk) - len(chunk) % itemsize
+      remainder = chunk[whole:]
+      yield encoder.encode(np.frombuffer(chunk[:whole], dtype=dtype))
+    yield encoder.flush()
+
+  def _spool_path(self, arcname):
+    return os.path.join(self._spool, arcname.replace('/', '_'))
+
+def load_many(paths, channels=None, workers=None, arrays=False):
+  '''
+  Loads many OpenMotorsport files concurrently on a pool of worker threads,
+  yielding each as soon as it has loaded (so not necessarily in the order
+  given). zlib releases the GIL whilst inflating, so the sessions load in
+  parallel on every core. For example:
+
+  >>> for path, session in load_many(paths, channels=[0, 4], workers=8):
+  ...   analyse(session)
+
+  Args:
+    paths
+      An iterable of the paths of the OpenMotorsport files to load.
+    channels
+      A list of the identifiers of the channels to load. Only these channels
+      are parsed and their data is read before a session is yielded.
+      Defaults to every channel. [optional]
+    workers
+      The number of worker threads. Defaults to the number of CPUs.
+      [optional]
+    arrays
+      Yield a dict of (times, data) arrays keyed by channel identifier in
+      place of each Session (which is closed once its arrays are read).
+      [optional]
+
+  Returns:
+    An iterator of (path, Session) tuples, or (path, dict) tuples when
+    arrays is True.
+
+  Raises an Exception (when it is reached) if a file cannot be loaded.
+  '''
+  def load(path):
+    session = Session(path, channel_ids=channels)
+    try:
+      session.preload(workers=1)
+      if arrays:
+        result = dict([(c.id, (np.asarray(c.timeseries.times),
+                               c.timeseries.data))
+                       for c in session.channels])
+        session.close()
+        return path, result
+      return path, session
+    except:
+      session.close()
+      raise
+
+  pool = ThreadPool(workers or multiprocessing.cpu_count())
+  try:
+    for result in pool.imap_unordered(load, paths):
+      yield result
+  finally:
+    pool.terminate()
+    pool.join()
+
 class Lap(Epoch):
   '''
   This class represents a single lap. It is a subclass of time.Epoch,
@@ -520,7 +1347,12 @@ class Channel(object):
               group=None,
               units=None,
               description=None,
-              timeseries=VariableTimeSeries()):
+              timeseries=VariableTimeSeries(),
+              codec=None,
+              times_codec=None,
+              dtype=None,
+              scale=None,
+              add_offset=None):
     '''
     Contructs a new instance of Channel.
 
@@ -538,13 +1370,38 @@ class Channel(object):
       timeseries
         An initial timeseries for this channel. If none is specified, it
         will default to an empty instance of VariableTimeSeries. [optional].
+      codec
+        The codec.Codec (or its description, e.g. 'shuffle,deflate:9') used
+        to store the data of this channel. Defaults to the archive
+        compression. [optional]
+      times_codec
+        The codec.Codec (or its description, e.g. 'delta,deflate') used to
+        store the times of a variable rate channel. Defaults to the archive
+        compression. [optional]
+      dtype
+        The dtype the data of this channel is stored as, one of
+        codec.STORAGE_DTYPES (e.g. 'int16' for ADC values or 'float64' for
+        GPS coordinates). Defaults to the dtype of the timeseries data.
+        [optional]
+      scale, add_offset
+        A linear conversion between the stored data and its values, where
+        value = stored * scale + add_offset. [optional]
+
+    Raises ValueError if dtype is not a storage dtype.
     '''
+    if dtype is not None and np.dtype(dtype).name not in STORAGE_DTYPES:
+      raise ValueError('Unsupported storage dtype %s' % dtype)
     self._id = int(id)
     self._name = name
     self._group = group
     self._units = units
     self._description = description
     self._timeseries = timeseries
+    self._codec = as_codec(codec)
+    self._times_codec = as_codec(times_codec)
+    self._dtype = None if dtype is None else np.dtype(dtype)
+    self._scale = scale
+    self._add_offset = add_offset
     self.__parent__ = None
 
   @property
@@ -587,20 +1444,89 @@ class Channel(object):
     '''Gets the channel timeseries [read-only].'''
     return self._timeseries
 
+  @property
+  def codec(self):
+    '''Gets the codec.Codec of the channel data, or None [read-only].'''
+    return self._codec
+
+  @property
+  def times_codec(self):
+    '''Gets the codec.Codec of the channel times, or None [read-only].'''
+    return self._times_codec
+
+  @property
+  def dtype(self):
+    '''Gets the storage dtype of the channel data, or None [read-only].'''
+    return self._dtype
+
+  @property
+  def scale(self):
+    '''Gets the scale of the stored channel data, or None [read-only].'''
+    return self._scale
+
+  @property
+  def add_offset(self):
+    '''Gets the offset added to the scaled channel data, or None [read-only].'''
+    return self._add_offset
+
+  @property
+  def storage_dtype(self):
+    '''
+    Gets the dtype the data of this channel is written as: its dtype, or
+    otherwise the dtype of its timeseries data if that can be stored as is
+    (and float32 if not) [read-only].
+    '''
+    if self._dtype is not None:
+      return self._dtype
+    dtype = self.timeseries.data.dtype
+    return dtype if dtype.name in STORAGE_DTYPES else np.dtype(np.float32)
+
+  def to_storage(self, data):
+    '''Converts an array of values to the stored data of this channel.'''
+    return to_storage(data, self.storage_dtype, self._scale, self._add_offset)
+
+  def stored_summary(self, stored=None):
+    '''
+    Gets the time.Summary of the values of this channel as they are stored
+    (and so loaded back), i.e. after they are rounded, clipped or scaled to
+    its storage dtype.
+
+    Args:
+      stored
+        The stored data of the timeseries, if it has already been converted
+        (see to_storage). [optional]
+    '''
+    timeseries = self.timeseries
+    summary = timeseries.summary
+    if not summary.count or getattr(timeseries, '_summary', None) is not None:
+      return summary
+    if stored is None:
+      if self._scale is None and not self._add_offset and \
+         self.storage_dtype == timeseries.data.dtype:
+        return summary
+      stored = self.to_storage(timeseries.data)
+    values = from_storage(stored, self._scale, self._add_offset)
+    return Summary.from_data(values, summary.first_time, summary.last_time)
+
+  @property
+  def summary(self):
+    '''Gets the time.Summary of this channel [read-only].'''
+    return self.timeseries.summary
+
   @property
   def min(self):
     '''Gets the minimum value of this channel [read-only].'''
-    return np.min(self.timeseries.data)
+    return self.timeseries.min
 
   @property
   def max(self):
-    '''Gets the avemaximumrage value of this channel [read-only].'''
-    return np.max(self.timeseries.data)
+    '''Gets the maximum value of this channel [read-only].'''
+    return self.timeseries.max
 
   @property
   def average(self):
     '''Gets the average value of this channel [read-only].'''
-    return np.average(self.timeseries.data)
+    return self.timeseries.mean
 
   def __repr__(self):
     return 'Channel %s (%s)' % (self.name, self.group)
@@ -686,9 +1612,11 @@ class Metadata(object):
 class LazyVariableTimeSeries(VariableTimeSeries):
   '''
   A subclass of time.VariableTimeSeries that provides lazy initialisation of
-  data and times.
+  data and times. The data and times are held by cache.CACHE (and read again
+  if they are evicted) until the time series is appended to, after which it
+  holds its own copies.
   '''
-  def __init__(self, parent, channel_id):
+  def __init__(self, parent, channel_id, summary=None):
     '''
     Construct a new instance of LazyVariableTimeSeries.
 
@@ -697,32 +1625,228 @@ class LazyVariableTimeSeries(VariableTimeSeries):
         The parent instance of openmotorsport.Session.
       channel_id
         The identifier of the channel this timeseries represents.
+      summary
+        The stored time.Summary of the channel. [optional]
     '''
     self._parent = parent
     self._channel_id = channel_id
-    self._loaded_data = False
-    self._loaded_times = False
+    self._pinned = False
     VariableTimeSeries.__init__(self)
+    self._summary = summary
+    self._key = CACHE.key(self)
 
   @property
   def data(self):
-    if not self._loaded_data:
-      self._data = self._parent._read_channel_data(self._channel_id)
-      self._loaded_data = True
-    return self._data
+    if self._pinned:
+      return self._data
+    return CACHE.get((self._key, 'bin'),
+      lambda: self._parent._read_channel_data(self._channel_id))
 
   @property
   def times(self):
+    if self._pinned:
+      return self._times
+    return CACHE.get((self._key, 'tms'),
+      lambda: self._parent._read_channel_times(self._channel_id))
+
+  @property
+  def raw(self):
+    '''
+    Gets the data as it is stored (e.g. integers before they are scaled to
+    values, see Channel.dtype), rather than its values.
+    '''
+    return CACHE.get((self._key, 'raw'),
+      lambda: self._parent._read_channel_data(self._channel_id, raw=True))
+
+  @property
+  def _loaded_data(self):
+    '''Gets whether the data is in memory (without reading it).'''
+    return self._pinned or (self._key, 'bin') in CACHE
+
+  @property
+  def _loaded_times(self):
+    '''Gets whether the times are in memory (without reading them).'''
+    return self._pinned or (self._key, 'tms') in CACHE
+
+  def load(self, archive=None):
+    '''
+    Loads the data and times of this time series into the cache if they are
+    not already loaded. An open zipfile.ZipFile of the parent session may be
+    given to read from instead of the session's own handle (see
+    Session.preload).
+    '''
+    if self._pinned:
+      return
+    CACHE.get((self._key, 'bin'),
+      lambda: self._parent._read_channel_data(self._channel_id, archive))
+    CACHE.get((self._key, 'tms'),
+      lambda: self._parent._read_channel_times(self._channel_id, archive))
+
+  def aload(self, loop=None):
+    '''
+    Loads the data and times of this time series (see load) on the shared
+    thread pool of the aio module, returning an asyncio future.
+    '''
+    from aio import run
+    return run(self.load, loop=loop)
+
+  def chunks(self, size=CHUNK_SAMPLES):
+    '''
+    Gets an iterator over consecutive instances of VariableTimeSeries (see
+    time.VariableTimeSeries.chunks). If this time series has not been loaded
+    and was written in blocks, each chunk is a block, read as it is reached.
+    '''
+    index = None
+    if not (self._loaded_data and self._loaded_times):
+      index = self._parent._read_channel_index(self._channel_id)
+    if index is None:
+      for chunk in VariableTimeSeries.chunks(self, size):
+        yield chunk
+      return
+
+    parent, id = self._parent, self._channel_id
+    for k in xrange(0, len(index)):
+      data = parent._read_channel_blocks(id, 'bin', parent._channel_dtype(id),
+                                         k, k + 1)
+      data = parent._channel_values(id, data)
+      yield VariableTimeSeries(
+        data=data,
+        times=parent._read_channel_blocks(id, 'tms', np.uint32, k, k + 1),
+        offset=self.offset,
+        dtype=data.dtype
+      )
+
+  def achunks(self, size=CHUNK_SAMPLES, loop=None):
+    '''
+    Gets an asynchronous iterator over the chunks of this time series (see
+    chunks), where each chunk is read on the shared thread pool of the aio
+    module.
+    '''
+    from aio import AsyncIterator
+    return AsyncIterator(self.chunks(size), loop)
+
+  def extend(self, data, times):
+    '''
+    Appends values and times to this time series (see
+    time.VariableTimeSeries.extend), after which it is no longer cached.
+    '''
+    if not self._pinned:
+      self._data, self._times = self.data, self.times
+      self._pinned = True
+      CACHE.discard(self._key)
+    VariableTimeSeries.extend(self, data, times)
+
+  def _float_times(self):
+    '''
+    Private method. Gets the sample times as float64 (see
+    time.VariableTimeSeries.at), which are cached alongside the times.
+    '''
+    if self._pinned:
+      return VariableTimeSeries._float_times(self)
+    return CACHE.get((self._key, 'f64'),
+                     lambda: self.times.astype(np.float64))
+
+  @property
+  def pyramid(self):
+    '''
+    Gets the time.Envelope of this time series, as stored with the session
+    or otherwise built from the data on first use (the stored envelope is
+    not used once the time series has been appended to).
+    '''
+    if self._pyramid is None and not self._pinned:
+      self._pyramid = self._parent._read_channel_envelope(self._channel_id)
+    return VariableTimeSeries.pyramid.fget(self)
+
+  def _search_times(self, time, side):
+    '''
+    Private method. Gets the index of a given time in the sample times (see
+    time.VariableTimeSeries.envelope). If the times have not been loaded and
+    were written in blocks, only the block that the time falls within is read.
+    '''
+    index = None
+    if not self._loaded_times:
+      index = self._parent._read_channel_index(self._channel_id)
+    if index is None:
+      return VariableTimeSeries._search_times(self, time, side)
+    if not len(index):
+      return 0
+
+    k = max(np.searchsorted(index[:, 1], time, side) - 1, 0)
+    times = self._parent._read_channel_blocks(self._channel_id, 'tms',
+                                              np.uint32, k, k + 1)
+    return int(index[k, 0]) + np.searchsorted(times, time, side)
+
+  def _times_at(self, indices):
+    '''
+    Private method. Gets the sample times at an array of indices. If the times
+    have not been loaded and were written in blocks, only the blocks that
+    hold the indices are read.
+    '''
+    index = None
     if not self._loaded_times:
-      self._times = self._parent._read_channel_times(self._channel_id)
-      self._loaded_times = True
-    return self._times
+      index = self._parent._read_channel_index(self._channel_id)
+    if index is None:
+      return VariableTimeSeries._times_at(self, indices)
+
+    indices = np.asarray(indices, dtype=np.int64)
+    offsets = index[:, 0].astype(np.int64)
+    blocks = np.searchsorted(offsets, indices, 'right') - 1
+    times = np.empty(len(indices), dtype=np.uint32)
+    for k in np.unique(blocks):
+      selected = blocks == k
+      block = self._parent._read_channel_blocks(self._channel_id, 'tms',
+                                                np.uint32, k, k + 1)
+      times[selected] = block[indices[selected] - offsets[k]]
+    return times
+
+  def _samples(self, start, end):
+    '''
+    Private method. Gets the data samples [start, end) (see
+    time.VariableTimeSeries.envelope), reading only the blocks that hold them
+    if the data has not been loaded and was written in blocks.
+    '''
+    if self._loaded_data or \
+       self._parent._read_channel_index(self._channel_id) is None:
+      return VariableTimeSeries._samples(self, start, end)
+    return self._parent._read_channel_samples(self._channel_id, start, end)
+
+  def slice(self, epoch):
+    '''
+    Gets a new instance of VariableTimeSeries for a given epoch (see
+    time.VariableTimeSeries.slice). If this time series has not been loaded
+    and was written in blocks, only the blocks that overlap the epoch are read.
+    '''
+    index = None
+    if not (self._loaded_data and self._loaded_times):
+      index = self._parent._read_channel_index(self._channel_id)
+    if index is None:
+      return VariableTimeSeries.slice(self, epoch)
+
+    # the first sample at or after the end of the epoch may be in the block
+    # following the one that the end of the epoch falls within
+    starts = index[:, 1]
+    first = max(np.searchsorted(starts, epoch.offset, 'right') - 1, 0)
+    last = min(np.searchsorted(starts, epoch.offset + epoch.length, 'right') + 1,
+               len(index))
+
+    parent = self._parent
+    read = parent._read_channel_blocks
+    data = read(self._channel_id, 'bin', parent._channel_dtype(self._channel_id),
+                first, last)
+    data = parent._channel_values(self._channel_id, data)
+    return VariableTimeSeries(
+      data=data,
+      times=read(self._channel_id, 'tms', np.uint32, first, last),
+      offset=self.offset,
+      dtype=data.dtype
+    ).slice(epoch)
 
 class LazyUniformTimeSeries(UniformTimeSeries):
   '''
   A subclass of time.UniformTimeSeries that provides lazy initialisation of data.
+  The data is held by cache.CACHE (see LazyVariableTimeSeries).
   '''
-  def __init__(self, frequency, parent, channel_id):
+  def __init__(self, frequency, parent, channel_id, offset=0, summary=None):
     '''
     Construct a new instance of LazyUniformTimeSeries.
 
@@ -733,18 +1857,156 @@ class LazyUniformTimeSeries(UniformTimeSeries):
         The parent instance of openmotorsport.Session.
       channel_id
         The identifier of the channel this timeseries represents.
+      offset
+        The time of the first sample of the channel. [optional]
+      summary
+        The stored time.Summary of the channel. [optional]
     '''
     self._parent = parent
     self._channel_id = channel_id
-    self._loaded_data = False
-    UniformTimeSeries.__init__(self, frequency=frequency)
+    self._pinned = False
+    UniformTimeSeries.__init__(self, frequency=frequency, offset=offset)
+    self._summary = summary
+    self._key = CACHE.key(self)
 
   @property
   def data(self):
+    if self._pinned:
+      return self._data
+    return CACHE.get((self._key, 'bin'),
+      lambda: self._parent._read_channel_data(self._channel_id))
+
+  @property
+  def raw(self):
+    '''
+    Gets the data as it is stored (e.g. integers before they are scaled to
+    values, see Channel.dtype), rather than its values.
+    '''
+    return CACHE.get((self._key, 'raw'),
+      lambda: self._parent._read_channel_data(self._channel_id, raw=True))
+
+  @property
+  def _loaded_data(self):
+    '''Gets whether the data is in memory (without reading it).'''
+    return self._pinned or (self._key, 'bin') in CACHE
+
+  def load(self, archive=None):
+    '''
+    Loads the data of this time series into the cache if it is not already
+    loaded. An open zipfile.ZipFile of the parent session may be given to
+    read from instead of the session's own handle (see Session.preload).
+    '''
+    if not self._pinned:
+      CACHE.get((self._key, 'bin'),
+        lambda: self._parent._read_channel_data(self._channel_id, archive))
+
+  def aload(self, loop=None):
+    '''
+    Loads the data of this time series (see load) on the shared thread pool
+    of the aio module, returning an asyncio future.
+    '''
+    from aio import run
+    return run(self.load, loop=loop)
+
+  def chunks(self, size=CHUNK_SAMPLES):
+    '''
+    Gets an iterator over consecutive instances of UniformTimeSeries (see
+    time.UniformTimeSeries.chunks). If this time series has not been loaded
+    and was written in blocks, each chunk is a block, read as it is reached.
+    '''
+    index = None
+    if not self._loaded_data:
+      index = self._parent._read_channel_index(self._channel_id)
+    if index is None:
+      for chunk in UniformTimeSeries.chunks(self, size):
+        yield chunk
+      return
+
+    parent, id = self._parent, self._channel_id
+    for k in xrange(0, len(index)):
+      data = parent._read_channel_blocks(id, 'bin', parent._channel_dtype(id),
+                                         k, k + 1)
+      data = parent._channel_values(id, data)
+      yield UniformTimeSeries(
+        frequency=self.frequency,
+        data=data,
+        offset=self.offset + int(index[k, 0]) * self.frequency.interval,
+        dtype=data.dtype
+      )
+
+  def achunks(self, size=CHUNK_SAMPLES, loop=None):
+    '''
+    Gets an asynchronous iterator over the chunks of this time series (see
+    chunks), where each chunk is read on the shared thread pool of the aio
+    module.
+    '''
+    from aio import AsyncIterator
+    return AsyncIterator(self.chunks(size), loop)
+
+  def extend(self, data):
+    '''
+    Appends data samples to this time series (see
+    time.UniformTimeSeries.extend), after which it is no longer cached.
+    '''
+    if not self._pinned:
+      self._data = self.data
+      self._pinned = True
+      CACHE.discard(self._key)
+    UniformTimeSeries.extend(self, data)
+
+  @property
+  def pyramid(self):
+    '''
+    Gets the time.Envelope of this time series, as stored with the session
+    or otherwise built from the data on first use (the stored envelope is
+    not used once the time series has been appended to).
+    '''
+    if self._pyramid is None and not self._pinned:
+      self._pyramid = self._parent._read_channel_envelope(self._channel_id)
+    return UniformTimeSeries.pyramid.fget(self)
+
+  def _samples(self, start, end):
+    '''
+    Private method. Gets the data samples [start, end) (see
+    LazyVariableTimeSeries._samples).
+    '''
+    if self._loaded_data or \
+       self._parent._read_channel_index(self._channel_id) is None:
+      return UniformTimeSeries._samples(self, start, end)
+    return self._parent._read_channel_samples(self._channel_id, start, end)
+
+  def slice(self, epoch):
+    '''
+    Gets a new instance of UniformTimeSeries for a given epoch (see
+    time.UniformTimeSeries.slice). If this time series has not been loaded and
+    was written in blocks, only the blocks that overlap the epoch are read.
+    '''
+    index = None
     if not self._loaded_data:
-      self._data = self._parent._read_channel_data(self._channel_id)
-      self._loaded_data = True
-    return self._data
+      index = self._parent._read_channel_index(self._channel_id)
+    if index is None:
+      return UniformTimeSeries.slice(self, epoch)
+
+    # the samples either side of the epoch are needed to interpolate
+    interval = self.frequency.interval
+    start = (epoch.offset - self.offset) // interval
+    end = -(-(epoch.offset + epoch.length - self.offset) // interval)
+    offsets = index[:, 0].astype(np.int64)
+    first = max(np.searchsorted(offsets, start, 'right') - 1, 0)
+    last = min(np.searchsorted(offsets, end, 'right'), len(index))
+
+    parent = self._parent
+    data = parent._read_channel_blocks(self._channel_id, 'bin',
+                                       parent._channel_dtype(self._channel_id),
+                                       first, last)
+    data = parent._channel_values(self._channel_id, data)
+    offset = self.offset + (int(offsets[first]) * interval if len(index) else 0)
+    return UniformTimeSeries(
+      frequency=self.frequency,
+      data=data,
+      offset=offset,
+      dtype=data.dtype
+    ).slice(epoch)
 
 # /----------------------------------------------------------------------/
 
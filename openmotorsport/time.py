@@ -18,8 +18,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+from fractions import Fraction, gcd
 import numpy as np
-from scipy import interpolate
 from scipy import signal
 
 # Base time is currently milliseconds (sufficient for up to 1KHz)
@@ -49,9 +50,11 @@ class Frequency(object):
     >>> f.interval
     200
     
+    An interval that is not a whole number of milliseconds is a float (e.g.
+    Frequency(120).interval is 8.333...) rather than being truncated.
     '''
-    self._frequency = frequency
-    self._interval = BASE_TIME / frequency
+    self._frequency = _exact(frequency)
+    self._interval = _exact(BASE_TIME / float(frequency))
 
   @staticmethod
   def from_interval(interval):
@@ -65,7 +68,8 @@ class Frequency(object):
     >>> f.frequency
     5
     '''
-    f = Frequency(BASE_TIME / int(interval))
+    f = Frequency(BASE_TIME / float(interval))
+    f._interval = _exact(float(interval))
     return f
 
   @property
@@ -77,11 +81,21 @@ class Frequency(object):
     return self._frequency
 
   def __repr__(self):
-    return '%dHz' % self._frequency
+    return '%gHz' % self._frequency
 
   def __eq__(self, other):
     return other and self.frequency == other.frequency
 
+def _exact(value):
+  '''
+  Private function. Gets a given number as an int if it is (within rounding
+  error of) a whole number, otherwise as a float.
+  '''
+  rounded = int(round(value))
+  if abs(value - rounded) <= 1e-9 * max(abs(value), 1):
+    return rounded
+  return float(value)
+
 
 class Epoch(object):
   '''
@@ -100,20 +114,422 @@ class Epoch(object):
     return self._offset
 
 
+class Summary(object):
+  '''
+  This class represents summary statistics of the data of a time series (its
+  count, min, max, mean and sum of squares, and the times of its first and
+  last samples). A summary is persisted for every channel of a session so
+  that these can be answered without loading the channel data.
+  '''
+  def __init__(self, count=0, min=None, max=None, mean=None, sum_squares=0.0,
+               first_time=None, last_time=None):
+    self.count = count
+    self.min = min
+    self.max = max
+    self.mean = mean
+    self.sum_squares = sum_squares
+    self.first_time = first_time
+    self.last_time = last_time
+
+  @staticmethod
+  def from_data(data, first_time=None, last_time=None):
+    '''
+    Creates a new instance of Summary of a given array of data samples (and
+    the times of the first and last samples).
+    '''
+    data = np.asarray(data)
+    if not np.size(data):
+      return Summary()
+    return Summary(
+      count=int(np.size(data)),
+      min=float(np.min(data)),
+      max=float(np.max(data)),
+      mean=float(np.mean(data, dtype=np.float64)),
+      sum_squares=float(np.dot(data, data.astype(np.float64))),
+      first_time=first_time,
+      last_time=last_time
+    )
+
+  @property
+  def variance(self):
+    '''Gets the (population) variance of the data samples.'''
+    if not self.count:
+      return None
+    return max(self.sum_squares / self.count - self.mean ** 2, 0.0)
+
+  def merge(self, other):
+    '''
+    Gets a new instance of Summary of the samples of this summary followed by
+    the samples of another.
+    '''
+    if not other.count:
+      return self
+    if not self.count:
+      return other
+    count = self.count + other.count
+    return Summary(
+      count=count,
+      min=min(self.min, other.min),
+      max=max(self.max, other.max),
+      mean=(self.mean * self.count + other.mean * other.count) / count,
+      sum_squares=self.sum_squares + other.sum_squares,
+      first_time=self.first_time,
+      last_time=other.last_time
+    )
+
+  def __repr__(self):
+    return 'Summary (%d samples, %s to %s)' % (self.count, self.min, self.max)
+
+  def __eq__(self, other):
+    return isinstance(other, Summary) and self.__dict__ == other.__dict__
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+
+CHUNK_SAMPLES = 65536
+'''The default number of samples in each chunk of a time series.'''
+
+ENVELOPE_BLOCK = 16
+'''The number of samples in each block of the finest level of an envelope.'''
+
+class Envelope(object):
+  '''
+  This class represents a multi-resolution min/max envelope (pyramid) of the
+  data of a time series. The first level holds the min, max and mean of each
+  block of ENVELOPE_BLOCK samples and each following level halves the number
+  of blocks (doubling their size) until a single block remains. A time series
+  can then be drawn at any zoom level from at most a few rows per pixel.
+  '''
+  def __init__(self, levels, size):
+    '''
+    Creates a new instance of Envelope from a list of levels (arrays of min,
+    max, mean rows, finest first) and the number of samples they summarise.
+    '''
+    self._levels = levels
+    self._size = size
+
+  @staticmethod
+  def from_data(data):
+    '''Creates a new instance of Envelope of a given array of data samples.'''
+    data = np.asarray(data)
+    levels = []
+    if not np.size(data):
+      return Envelope(levels, 0)
+
+    starts = np.arange(0, np.size(data), ENVELOPE_BLOCK)
+    counts = np.diff(np.append(starts, np.size(data)))
+    mins = np.minimum.reduceat(data, starts)
+    maxs = np.maximum.reduceat(data, starts)
+    sums = np.add.reduceat(data, starts, dtype=np.float64)
+    while True:
+      levels.append(np.column_stack((mins, maxs, sums / counts))
+                    .astype(np.float32))
+      if len(counts) == 1:
+        return Envelope(levels, np.size(data))
+      pairs = np.arange(0, len(counts), 2)
+      mins = np.minimum.reduceat(mins, pairs)
+      maxs = np.maximum.reduceat(maxs, pairs)
+      sums = np.add.reduceat(sums, pairs)
+      counts = np.add.reduceat(counts, pairs)
+
+  @staticmethod
+  def from_array(array, size):
+    '''
+    Creates a new instance of Envelope from the rows of every level (as
+    returned by Envelope.to_array) and the number of samples they summarise.
+    '''
+    levels, offset = [], 0
+    blocks = -(-size // ENVELOPE_BLOCK)
+    while blocks:
+      levels.append(array[offset:offset + blocks])
+      offset += blocks
+      blocks = 0 if blocks == 1 else -(-blocks // 2)
+    return Envelope(levels, size)
+
+  @property
+  def levels(self):
+    '''Gets the list of levels, finest first.'''
+    return self._levels
+
+  @property
+  def size(self):
+    '''Gets the number of samples summarised by this envelope.'''
+    return self._size
+
+  def to_array(self):
+    '''Gets the rows of every level as a single array.'''
+    if not self._levels:
+      return np.zeros((0, 3), dtype=np.float32)
+    return np.concatenate(self._levels)
+
+  def select(self, start, end, max_points):
+    '''
+    Gets the rows of the finest level that covers the samples [start, end)
+    in at most max_points rows (or as few as possible).
+
+    Returns:
+      A tuple of the index of the first sample of each row and the rows.
+    '''
+    block = ENVELOPE_BLOCK
+    for level in self._levels:
+      first, last = start // block, (end - 1) // block + 1
+      if last - first <= max_points or level is self._levels[-1]:
+        return np.arange(first, last) * block, level[first:last]
+      block *= 2
+
+def envelope(timeseries, start, end, max_points, time_at):
+  '''
+  Gets the envelope of the samples [start, end) of a given time series
+  (see VariableTimeSeries.envelope), where time_at maps an array of sample
+  indices to their times.
+  '''
+  if end - start <= max_points:
+    data = timeseries._samples(start, end)
+    return time_at(np.arange(start, end)), data, data, data
+  indices, rows = timeseries.pyramid.select(start, end, max_points)
+  return time_at(indices), rows[:, 0], rows[:, 1], rows[:, 2]
+
+def extend_buffer(array, buffer, values, dtype=None):
+  '''
+  Appends values to an array that is the filled prefix of a given buffer,
+  which is only reallocated (to double its capacity) once it is full, so that
+  appending one value at a time takes amortised constant time. The buffer may
+  be None, or any array that the given array is not a prefix of, in which case
+  the array is copied into a new buffer. Views returned by earlier calls are
+  never modified.
+
+  Args:
+    dtype
+      The dtype of the result. Defaults to that of the array. [optional]
+
+  Returns:
+    A tuple of the new array (a view of the buffer) and the buffer.
+  '''
+  filled = len(array)
+  if np.isscalar(values) and buffer is not None and array.base is buffer and \
+     filled < len(buffer) and (dtype is None or buffer.dtype == dtype):
+    # a single value that fits (the common case when logging)
+    buffer[filled] = values
+    return buffer[:filled + 1], buffer
+
+  dtype = np.dtype(dtype or array.dtype)
+  values = np.asanyarray(values, dtype=dtype).ravel()
+  size = filled + len(values)
+  if buffer is None or array.base is not buffer or buffer.dtype != dtype or \
+     len(buffer) < size:
+    capacity = len(buffer) if buffer is not None and array.base is buffer \
+      else filled
+    grown = np.empty(max(size, 2 * capacity, 16), dtype=dtype)
+    grown[:filled] = array
+    buffer = grown
+  buffer[filled:size] = values
+  return buffer[:size], buffer
+
+def extend_ring(buffer, start, end, values):
+  '''
+  Appends values to the samples [start, end) of a ring buffer, which is twice
+  the capacity of the ring, so that the samples are always contiguous. The
+  oldest samples are dropped to stay within the capacity, and the newest are
+  moved back to the start of the buffer when it is full (at most once per
+  `capacity` values, so appending takes amortised constant time).
+
+  Returns:
+    The new (start, end) of the samples.
+  '''
+  capacity = len(buffer) // 2
+  if np.isscalar(values) and end < len(buffer):
+    buffer[end] = values
+    return max(start, end + 1 - capacity), end + 1
+
+  values = np.asanyarray(values, dtype=buffer.dtype).ravel()
+  count = len(values)
+  if count >= capacity:
+    buffer[:capacity] = values[count - capacity:]
+    return 0, capacity
+  if end + count > len(buffer):
+    keep = min(end - start, capacity - count)
+    buffer[:keep] = buffer[end - keep:end]
+    start, end = 0, keep
+  buffer[end:end + count] = values
+  return max(start, end + count - capacity), end + count
+
+def interpolate_at(data, positions, fill=None, out=None):
+  '''
+  Linearly interpolates data at given (scalar or array) fractional sample
+  positions, e.g. 2.5 is half way between the third and fourth samples. Only
+  the neighbouring samples of each position are read, so the cost does not
+  depend on the length of the data.
+
+  Args:
+    fill
+      The value of positions outside of the data (e.g. NaN). By default,
+      these raise a ValueError. [optional]
+    out
+      An array to write the result to (e.g. a column of a matrix). [optional]
+
+  Raises ValueError if any position is outside of the data (and no fill is
+  given).
+  '''
+  positions = np.asarray(positions, dtype=np.float64)
+  count = len(data)
+  inside = (positions >= 0) & (positions <= count - 1)
+  if fill is None and (not count or not np.all(inside)):
+    raise ValueError('Time is outside of the time series.')
+  if not count:
+    result = np.empty(positions.shape) if out is None else out
+    result[...] = fill
+    return result
+
+  clipped = np.clip(np.nan_to_num(positions), 0, count - 1)
+  lower = np.minimum(clipped.astype(np.intp), max(count - 2, 0))
+  upper = np.minimum(lower + 1, count - 1)
+  below = data[lower]
+  result = np.add(below, (clipped - lower) * (data[upper] - below), out=out)
+  if fill is not None:
+    if out is None:
+      return np.where(inside, result, fill)
+    out[~inside] = fill
+  return result
+
+
+class Resampler(object):
+  '''
+  This class represents a polyphase resampler by a rational factor up/down
+  (e.g. 3/5 from 200Hz to 120Hz), which upsamples, applies an anti-aliasing
+  low pass filter and downsamples in one step, computing only the output
+  samples. The result is the same as scipy.signal.resample_poly, but long
+  arrays are resampled in chunks (so the memory required does not grow with
+  their length) and filter designs are shared between resamplers of the same
+  factor. For example:
+
+  >>> resampler = Resampler.from_frequencies(Frequency(200), Frequency(120))
+  >>> resampler.up, resampler.down
+  (3, 5)
+  >>> len(resampler(np.zeros(1000)))
+  600
+  '''
+
+  _filters = {}
+  _lock = threading.Lock()
+
+  def __init__(self, up, down):
+    '''
+    Creates a new instance of Resampler by a factor of up/down.
+
+    Raises ValueError if either is not a positive integer.
+    '''
+    if up < 1 or down < 1 or int(up) != up or int(down) != down:
+      raise ValueError('Resampling factors must be positive integers.')
+    divisor = gcd(int(up), int(down))
+    self._up, self._down = int(up) // divisor, int(down) // divisor
+    self._taps, self._delay = None, 0
+    if self._up != self._down:
+      self._taps, self._delay = Resampler.design(self._up, self._down)
+
+  @staticmethod
+  def from_frequencies(source, target, max_denominator=1000):
+    '''
+    Creates a new instance of Resampler from one Frequency to another. The
+    ratio of frequencies that are not whole numbers of Hz is approximated by a
+    fraction with a denominator of at most max_denominator.
+    '''
+    source = Fraction.from_float(float(source.frequency))
+    target = Fraction.from_float(float(target.frequency))
+    ratio = (target.limit_denominator(max_denominator) /
+             source.limit_denominator(max_denominator))
+    return Resampler(ratio.numerator, ratio.denominator)
+
+  @staticmethod
+  def design(up, down):
+    '''
+    Gets the (cached) anti-aliasing filter of a given factor up/down, as a
+    tuple of its taps (scaled by `up` and padded so that its delay is a whole
+    number of output samples) and its delay in output samples.
+    '''
+    key = (up, down)
+    with Resampler._lock:
+      if key not in Resampler._filters:
+        # the same Kaiser windowed sinc as scipy.signal.resample_poly
+        rate = max(up, down)
+        half = 10 * rate
+        taps = signal.firwin(2 * half + 1, 1.0 / rate, window=('kaiser', 5.0))
+        pad = down - half % down
+        taps = np.concatenate((np.zeros(pad), taps * up))
+        Resampler._filters[key] = (taps, (half + pad) // down)
+      return Resampler._filters[key]
+
+  @property
+  def up(self):
+    return self._up
+
+  @property
+  def down(self):
+    return self._down
+
+  def output_size(self, size):
+    '''Gets the number of samples that a given number of samples becomes.'''
+    return -(-size * self._up // self._down)
+
+  def chunks(self, data, size=CHUNK_SAMPLES):
+    '''
+    Gets an iterator over consecutive arrays of at most `size` resampled
+    samples of given data. Each array is computed from only the input samples
+    that it depends on.
+    '''
+    data = np.asanyarray(data)
+    up, down, taps, delay = self._up, self._down, self._taps, self._delay
+    total = self.output_size(len(data))
+    if taps is None:
+      for first in xrange(0, total, size):
+        yield np.array(data[first:first + size], dtype=np.float64)
+      return
+
+    for first in xrange(0, total, size):
+      last = min(first + size, total)
+      # the input samples [start, end) that the outputs depend on, where
+      # start * up is a multiple of down (so that the outputs align)
+      lowest = ((first + delay) * down - len(taps) + 1) // up
+      start = max(lowest // down * down, 0)
+      end = (last + delay - 1) * down // up + 1
+      segment = data[start:end]
+      if len(segment) < end - start:
+        segment = np.concatenate((segment,
+                                  np.zeros(end - start - len(segment))))
+      output = signal.upfirdn(taps, segment, up, down)
+      skip = first + delay - start * up // down
+      yield output[skip:skip + last - first]
+
+  def __call__(self, data, size=CHUNK_SAMPLES):
+    '''Gets an array of the resampled samples of given data (see chunks).'''
+    output = np.empty(self.output_size(len(data)))
+    position = 0
+    for chunk in self.chunks(data, size):
+      output[position:position + len(chunk)] = chunk
+      position += len(chunk)
+    return output
+
 class VariableTimeSeries(object):
   '''This class represents a time series with a variable sampling rate.'''
 
-  def __init__(self, data=[], times=[], offset=0):
+  def __init__(self, data=[], times=[], offset=0, dtype=np.float32,
+               copy=True):
     '''
-    Create a new instance of VariableTimeSeries.
+    Create a new instance of VariableTimeSeries. The data is held as float32
+    unless another dtype (e.g. float64) is given. Arrays of the right dtype
+    are shared rather than copied if copy is False.
 
     Raises ValueError if data and times are not of equal length.
     '''
-    self._data = np.array(data, dtype=np.float32)
-    self._times = np.array(times, dtype=np.uint32)
+    self._data = np.array(data, dtype=dtype, copy=copy)
+    self._times = np.array(times, dtype=np.uint32, copy=copy)
     self._offset = offset
-      
-    if np.size(self.data) != np.size(self.times):
+    self._summary = None
+    self._pyramid = None
+    self._ftimes = None
+    self._buffers = (None, None)
+
+    if np.size(self._data) != np.size(self._times):
       raise ValueError('Data/times mismatch. Lengths must be equal.')
 
   @property
@@ -139,36 +555,144 @@ class VariableTimeSeries(object):
     '''Gets the end time of this time series (start time plus duration).'''
     return self.offset + self.duration
 
+  @property
+  def summary(self):
+    '''
+    Gets the time.Summary of this time series, either as stored with the
+    session it was loaded from or computed from the data.
+    '''
+    if self._summary is not None:
+      return self._summary
+    times = self.times
+    if not len(times):
+      return Summary()
+    return Summary.from_data(self.data, int(times[0]), int(times[-1]))
+
   @property
   def min(self):
     '''Convienience property for getting the min data value.'''
+    if self._summary is not None:
+      return self._summary.min
     return np.min(self.data)
 
   @property
   def max(self):
     '''Convienience property for getting the mas data value.'''
-    return np.max(self.data)      
+    if self._summary is not None:
+      return self._summary.max
+    return np.max(self.data)
+
+  @property
+  def mean(self):
+    '''Convienience property for getting the mean data value.'''
+    if self._summary is not None:
+      return self._summary.mean
+    return np.average(self.data)
+
+  @property
+  def pyramid(self):
+    '''Gets the time.Envelope of this time series (built on first use).'''
+    if self._pyramid is None:
+      self._pyramid = Envelope.from_data(self.data)
+    return self._pyramid
+
+  def envelope(self, epoch, max_points):
+    '''
+    Gets the min/max envelope of this time series over a given epoch in at
+    most (about) max_points points, for plotting. The actual samples are
+    returned when there are few enough of them, otherwise the rows of the
+    finest level of the pyramid that fits, so the cost is proportional to
+    max_points rather than the number of samples.
+
+    Returns:
+      A tuple of arrays of the times, min, max and mean of each point.
+    '''
+    start = self._search_times(epoch.offset, 'left')
+    end = self._search_times(epoch.offset + epoch.length, 'right')
+    return envelope(self, start, end, max_points, self._times_at)
+
+  def _search_times(self, time, side):
+    '''
+    Private method. Gets the index of a given time in the sample times (see
+    numpy.searchsorted).
+    '''
+    return np.searchsorted(self.times, time, side)
+
+  def _times_at(self, indices):
+    '''Private method. Gets the sample times at an array of indices.'''
+    return self.times[indices]
+
+  def _samples(self, start, end):
+    '''Private method. Gets the data samples [start, end) (see envelope).'''
+    return self.data[start:end]
 
   def at(self, time):
-    '''Gets a data sample at a given time using linear interpolation.'''
-    f = interpolate.interp1d(self.times, self.data)  # TODO cache
-    return f(time)
+    '''
+    Gets the data sample(s) at a given time (or array of times) using linear
+    interpolation. Each time is found by a binary search of the sample times.
+
+    Raises ValueError if any time is outside of this time series.
+    '''
+    return interpolate_at(self.data, self.positions_at(time))
+
+  def positions_at(self, times):
+    '''
+    Gets the fractional sample positions of given (scalar or array) times
+    (see interpolate_at), which are outside of [0, len - 1] for times outside
+    of this time series.
+    '''
+    times = np.asarray(times, dtype=np.float64)
+    samples = self._float_times()
+    count = len(samples)
+    if not count:
+      return np.zeros(times.shape) - 1
+    lower = np.clip(np.searchsorted(samples, times, 'right') - 1, 0,
+                    max(count - 2, 0))
+    upper = np.minimum(lower + 1, count - 1)
+    span = samples[upper] - samples[lower]
+    return lower + (times - samples[lower]) / np.where(span > 0, span, 1)
+
+  def _float_times(self):
+    '''
+    Private method. Gets the sample times as float64 (for searching with
+    fractional times), converted on first use.
+    '''
+    if self._ftimes is None:
+      self._ftimes = self.times.astype(np.float64)
+    return self._ftimes
 
   def get(self, index):
     '''Gets a data sample at a given index.'''
     return self.data[index]
 
   def index_at(self, time):
-    indices = np.where(self.times >= time)[0]
-    if not np.size(indices):
+    '''
+    Gets the index of the first sample at or after a given time by a binary
+    search of the sample times.
+
+    Raises ValueError if the time is after the last sample.
+    '''
+    return int(self.indices_at(time))
+
+  def indices_at(self, times):
+    '''
+    Gets the indices of the first samples at or after each of an array of
+    times (see index_at).
+
+    Raises ValueError if any time is after the last sample.
+    '''
+    indices = np.searchsorted(self._float_times(),
+                              np.asarray(times, dtype=np.float64), 'left')
+    if np.any(indices >= len(self)):
       raise ValueError('Time exceeds length of time series.')
-    return indices[0]
+    return indices
 
   def slice(self, epoch):
     '''
     Gets a new instance of VariableTimeSeries that contains only the data/times
     for a given epoch. This method currently does not implement interpolation
-    and will only return actual actual data samples.
+    and will only return actual actual data samples. The data and times are
+    views of those of this time series (see copy).
     '''
     start = self.index_at(epoch.offset)
     end = self.index_at(epoch.offset + epoch.length) + 1# inclusive
@@ -176,22 +700,86 @@ class VariableTimeSeries(object):
     return VariableTimeSeries(
       data=self.data[start:end],
       times=self.times[start:end],
-      offset=epoch.offset
+      offset=epoch.offset,
+      dtype=self.data.dtype,
+      copy=False
     )
 
+  def resample(self, frequency):
+    '''
+    Gets a new instance of UniformTimeSeries of this time series resampled at
+    a given Frequency, from the time of its first sample. The samples are
+    linearly interpolated onto a grid at a whole multiple of the frequency
+    that is at least the (median) rate of this time series, which is then
+    downsampled with anti-aliasing (see Resampler).
+    '''
+    times = self._float_times()
+    if not len(times):
+      return UniformTimeSeries(frequency, [], self.offset, self.data.dtype)
+
+    factor = 1
+    if len(times) > 1:
+      median = np.median(np.diff(times))
+      if median > 0:
+        factor = max(int(np.ceil(frequency.interval / median)), 1)
+    interval = frequency.interval / float(factor)
+    count = int((times[-1] - times[0]) // interval) + 1
+    grid = np.minimum(times[0] + np.arange(count) * interval, times[-1])
+
+    return UniformTimeSeries(
+      frequency=frequency,
+      data=Resampler(1, factor)(self.at(grid)),
+      offset=int(self.times[0]),
+      dtype=self.data.dtype
+    )
+
+  def copy(self):
+    '''
+    Gets a new instance of VariableTimeSeries with copies of the data and
+    times of this time series (e.g. to modify a slice without modifying the
+    time series it was sliced from).
+    '''
+    return VariableTimeSeries(self.data, self.times, self.offset,
+                              self.data.dtype)
+
   def append(self, data, time):
     '''
-    Appends a value and times to this time series.
+    Appends a value and times to this time series (see extend).
 
     Raises ValueError if value and time are not equal in length.    
     '''
-    if np.size(data) != np.size(time):
+    self.extend(data, time)
+
+  def extend(self, data, times):
+    '''
+    Appends arrays of values and times to this time series. The data and times
+    are held in buffers with spare capacity, so appending takes amortised
+    constant time (per value) rather than copying the whole time series.
+
+    Raises ValueError if data and times are not equal in length.
+    '''
+    if not (np.isscalar(data) and np.isscalar(times)) and \
+       np.size(data) != np.size(times):
       raise ValueError('Data/times mismatch. Lengths must be equal.')
 
-    self._data = np.append(self.data,
-                           np.asanyarray(data, dtype=self._data.dtype))
-    self._times = np.append(self.times,
-                            np.asanyarray(time, dtype=self._data.dtype))
+    self._data, data_buffer = extend_buffer(self._data, self._buffers[0],
+                                            data)
+    self._times, times_buffer = extend_buffer(self._times, self._buffers[1],
+                                              times)
+    self._buffers = (data_buffer, times_buffer)
+    self._summary = None
+    self._pyramid = None
+    self._ftimes = None
+
+  def chunks(self, size=CHUNK_SAMPLES):
+    '''
+    Gets an iterator over consecutive instances of VariableTimeSeries of at
+    most `size` samples each (which are views of this time series).
+    '''
+    data, times = self.data, self.times
+    for i in xrange(0, len(data), size):
+      yield VariableTimeSeries(data[i:i + size], times[i:i + size],
+                               self.offset, data.dtype, copy=False)
 
   def __len__(self):
     return np.size(self.data)
@@ -208,14 +796,156 @@ class VariableTimeSeries(object):
   def __ne__(self, other):
     return not self.__eq__(other)
 
+class UniformTimes(object):
+  '''
+  This class represents the sample times of a UniformTimeSeries (offset plus
+  a multiple of the interval) without materialising them. It supports len(),
+  indexing, slicing, searchsorted() and arithmetic with scalars (e.g. time()),
+  and is converted to an array (with numpy.asarray) only on demand:
+
+  >>> times = UniformTimes(1000, 200, 3)
+  >>> times[-1]
+  1400
+  >>> times.searchsorted(1100)
+  1
+  >>> np.asarray(times)
+  array([1000, 1200, 1400])
+  '''
+  def __init__(self, offset, interval, count):
+    self._offset = offset
+    self._interval = interval
+    self._count = count
+
+  @property
+  def offset(self):
+    return self._offset
+
+  @property
+  def interval(self):
+    return self._interval
+
+  @property
+  def dtype(self):
+    '''Gets the dtype of the times as an array.'''
+    return (np.arange(0) * self._interval + self._offset).dtype
+
+  def searchsorted(self, value, side='left'):
+    '''
+    Gets the indices at which given (scalar or array) times would be inserted
+    to keep the times sorted (see numpy.searchsorted).
+    '''
+    positions = (np.asarray(value, dtype=np.float64) - self._offset) / \
+      self._interval
+    if side == 'left':
+      indices = np.ceil(positions)
+    else:
+      indices = np.floor(positions) + 1
+    return np.clip(indices, 0, self._count).astype(np.intp)
+
+  def __len__(self):
+    return self._count
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      start, stop, step = index.indices(self._count)
+      if step < 0:
+        return np.asarray(self)[index]
+      return UniformTimes(self._offset + start * self._interval,
+                          self._interval * step,
+                          len(xrange(start, stop, step)))
+    indices = np.asarray(index)
+    if indices.dtype == np.bool_:
+      return np.asarray(self)[index]
+    indices = np.where(indices < 0, indices + self._count, indices)
+    if np.any((indices < 0) | (indices >= self._count)):
+      raise IndexError('Index out of range.')
+    return self._offset + indices * self._interval
+
+  def __iter__(self):
+    for i in xrange(self._count):
+      yield self._offset + i * self._interval
+
+  def __array__(self, dtype=None):
+    array = np.arange(self._count) * self._interval + self._offset
+    return array if dtype is None else array.astype(dtype)
+
+  def __eq__(self, other):
+    if isinstance(other, UniformTimes):
+      return len(self) == len(other) and (not len(self) or
+        (self._offset == other._offset and
+         (len(self) == 1 or self._interval == other._interval)))
+    return np.array_equal(np.asarray(self), other)
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+  def __repr__(self):
+    return 'UniformTimes(%r, %r, %d)' % (self._offset, self._interval,
+                                         self._count)
+
+  # NB: arithmetic with a scalar is uniform, otherwise it is done on an array
+
+  def __add__(self, other):
+    if np.isscalar(other):
+      return UniformTimes(self._offset + other, self._interval, self._count)
+    return np.asarray(self) + other
+
+  __radd__ = __add__
+
+  def __sub__(self, other):
+    if np.isscalar(other):
+      return UniformTimes(self._offset - other, self._interval, self._count)
+    return np.asarray(self) - other
+
+  def __rsub__(self, other):
+    if np.isscalar(other):
+      return UniformTimes(other - self._offset, -self._interval, self._count)
+    return other - np.asarray(self)
+
+  def __mul__(self, other):
+    if np.isscalar(other):
+      return UniformTimes(self._offset * other, self._interval * other,
+                          self._count)
+    return np.asarray(self) * other
+
+  __rmul__ = __mul__
+
+  def __truediv__(self, other):
+    if np.isscalar(other):
+      return UniformTimes(np.true_divide(self._offset, other),
+                          np.true_divide(self._interval, other), self._count)
+    return np.true_divide(np.asarray(self), other)
+
+  def __rtruediv__(self, other):
+    return np.true_divide(other, np.asarray(self))
+
+  def __div__(self, other):
+    # integers are floor divided time by time, as they are in an array
+    if np.isscalar(other) and \
+       np.issubdtype(np.result_type(self.dtype, other), np.floating):
+      return self.__truediv__(other)
+    return np.asarray(self) / other
+
+  def __rdiv__(self, other):
+    return other / np.asarray(self)
+
 class UniformTimeSeries(object):
   '''
   This class represents a time series with uniform data samples.
   '''
-  def __init__(self, frequency, data=[], offset=0, **kwargs):
+  def __init__(self, frequency, data=[], offset=0, dtype=np.float32,
+               copy=True, **kwargs):
+    '''
+    Create a new instance of UniformTimeSeries. The data is held as float32
+    unless another dtype is given, and an array of the right dtype is shared
+    rather than copied if copy is False.
+    '''
     self._frequency = frequency
-    self._data = np.array(data, dtype=np.float32)
+    self._data = np.array(data, dtype=dtype, copy=copy)
     self._offset = offset
+    self._summary = None
+    self._pyramid = None
+    self._buffer = None
 
   @property
   def frequency(self):
@@ -235,72 +965,205 @@ class UniformTimeSeries(object):
 
   @property
   def times(self):
-    # TODO cache
-    return np.arange(self.offset, self.end_time, self.frequency.interval)
+    '''
+    Gets the sample times as an instance of UniformTimes, which computes them
+    on demand rather than allocating an array.
+    '''
+    return UniformTimes(self.offset, self.frequency.interval, len(self))
     
   @property
   def end_time(self):
     '''Gets the end time of this time series (start time plus duration).'''
     return self.offset + self.duration
 
+  @property
+  def summary(self):
+    '''
+    Gets the time.Summary of this time series, either as stored with the
+    session it was loaded from or computed from the data.
+    '''
+    if self._summary is not None:
+      return self._summary
+    if not len(self):
+      return Summary()
+    last_time = self.offset + (len(self) - 1) * self.frequency.interval
+    return Summary.from_data(self.data, self.offset, last_time)
+
   @property
   def min(self):
     '''Convienience property for getting the min data value.'''
+    if self._summary is not None:
+      return self._summary.min
     return np.min(self.data)
 
   @property
   def max(self):
     '''Convienience property for getting the mas data value.'''
-    return np.max(self.data)     
+    if self._summary is not None:
+      return self._summary.max
+    return np.max(self.data)
+
+  @property
+  def mean(self):
+    '''Convienience property for getting the mean data value.'''
+    if self._summary is not None:
+      return self._summary.mean
+    return np.average(self.data)
+
+  @property
+  def pyramid(self):
+    '''Gets the time.Envelope of this time series (built on first use).'''
+    if self._pyramid is None:
+      self._pyramid = Envelope.from_data(self.data)
+    return self._pyramid
+
+  def envelope(self, epoch, max_points):
+    '''
+    Gets the min/max envelope of this time series over a given epoch in at
+    most (about) max_points points (see VariableTimeSeries.envelope).
+    '''
+    interval = self.frequency.interval
+    size = self.pyramid.size if self._summary is None else self._summary.count
+    start = int(max(-(-(epoch.offset - self.offset) // interval), 0))
+    end = min(int((epoch.offset + epoch.length - self.offset) // interval) + 1,
+              size)
+    return envelope(self, start, max(start, end), max_points,
+                    lambda i: self.offset + i * interval)
+
+  def _samples(self, start, end):
+    '''Private method. Gets the data samples [start, end) (see envelope).'''
+    return self.data[start:end]
 
   def append(self, data):
-    '''Appends a given data sample to this time series.'''
-    self._data = np.append(self.data,
-                           np.asanyarray(data, dtype=self._data.dtype))
+    '''Appends a given data sample to this time series (see extend).'''
+    self.extend(data)
+
+  def extend(self, data):
+    '''
+    Appends an array of data samples to this time series, in amortised
+    constant time per sample (see VariableTimeSeries.extend).
+    '''
+    self._data, self._buffer = extend_buffer(self._data, self._buffer, data)
+    self._summary = None
+    self._pyramid = None
 
   def at(self, time):
-    '''Gets a data sample at a given time using linear interpolation.'''    
-    f = interpolate.interp1d(self.times, self.data)
-    return f(time)
+    '''
+    Gets the data sample(s) at a given time (or array of times) using linear
+    interpolation. Each time is found arithmetically from the frequency.
+
+    Raises ValueError if any time is outside of this time series.
+    '''
+    return interpolate_at(self.data, self.positions_at(time))
+
+  def positions_at(self, times):
+    '''
+    Gets the fractional sample positions of given (scalar or array) times
+    (see VariableTimeSeries.positions_at).
+    '''
+    return (np.asarray(times, dtype=np.float64) - self.offset) / \
+      self.frequency.interval
 
   def get(self, index):
     '''Gets a data sample at a given index.'''
     return self.data[index]    
 
+  def index_at(self, time):
+    '''
+    Gets the index of the first sample at or after a given time, which is
+    found arithmetically from the frequency.
+
+    Raises ValueError if the time is after the last sample.
+    '''
+    return int(self.indices_at(time))
+
+  def indices_at(self, times):
+    '''
+    Gets the indices of the first samples at or after each of an array of
+    times (see index_at).
+
+    Raises ValueError if any time is after the last sample.
+    '''
+    positions = (np.asarray(times, dtype=np.float64) - self.offset) / \
+      self.frequency.interval
+    indices = np.maximum(np.ceil(positions), 0).astype(np.intp)
+    if np.any(indices >= len(self)):
+      raise ValueError('Time exceeds length of time series.')
+    return indices
+
   def slice(self, epoch):
-    times = np.arange(self.offset, self.end_time, self.frequency.interval)
-    f = interpolate.interp1d(times, self.data)
-    epoch_times = np.arange(epoch.offset, epoch.offset + epoch.length,
-                            self.frequency.interval)
-    
+    '''
+    Gets a new instance of UniformTimeSeries with samples from the offset of a
+    given epoch, which are interpolated if the epoch is not aligned with the
+    samples of this time series. Otherwise, the data is a view of that of
+    this time series (see copy).
+
+    Raises ValueError if the epoch is not within this time series.
+    '''
+    interval = self.frequency.interval
+    count = max(int(np.ceil(float(epoch.length) / interval)), 0)
+    start, remainder = divmod(epoch.offset - self.offset, interval)
+
+    if remainder:
+      data = interpolate_at(self.data,
+        np.arange(count) + float(epoch.offset - self.offset) / interval)
+    else:
+      start = int(start)
+      if not len(self) or (count and (start < 0 or start + count > len(self))):
+        raise ValueError('Time is outside of the time series.')
+      data = self.data[start:start + count]
+
     return UniformTimeSeries(
       frequency=self.frequency,
-      data=f(epoch_times),
-      offset=epoch.offset
+      data=data,
+      offset=epoch.offset,
+      dtype=self.data.dtype,
+      copy=False
     )
 
+  def copy(self):
+    '''
+    Gets a new instance of UniformTimeSeries with a copy of the data of this
+    time series (see VariableTimeSeries.copy).
+    '''
+    return UniformTimeSeries(self.frequency, self.data, self.offset,
+                             self.data.dtype)
+
   def resample(self, frequency):
+    '''
+    Gets a new instance of UniformTimeSeries of this time series resampled to
+    a given Frequency (by any rational factor, see Resampler).
+    '''
     if frequency == self.frequency or not np.size(self.data):
       data = self.data
-    elif frequency.frequency > self.frequency.frequency:
-      factor = frequency.frequency / self.frequency.frequency
-      data = self.upsample(factor)
     else:
-      factor = self.frequency.frequency / frequency.frequency
-      data = self.downsample(factor)
+      data = Resampler.from_frequencies(self.frequency, frequency)(self.data)
 
     return UniformTimeSeries(
       frequency=frequency,
       data=data,
-      offset=self.offset
+      offset=self.offset,
+      dtype=self.data.dtype
     )
 
   def downsample(self, factor):
-    return signal.decimate(self.data, factor)
+    '''Gets the data downsampled by a given integer factor.'''
+    return Resampler(1, factor)(self.data)
 
   def upsample(self, factor):
-    # TODO find appropriate resampling method
-    return signal.resample(self.data, factor * len(self))
+    '''Gets the data upsampled by a given integer factor.'''
+    return Resampler(factor, 1)(self.data)
+
+  def chunks(self, size=CHUNK_SAMPLES):
+    '''
+    Gets an iterator over consecutive instances of UniformTimeSeries of at
+    most `size` samples each.
+    '''
+    data = self.data
+    for i in xrange(0, len(data), size):
+      yield UniformTimeSeries(self.frequency, data[i:i + size],
+                              self.offset + i * self.frequency.interval,
+                              data.dtype, copy=False)
 
   def __len__(self):
     return np.size(self.data)
@@ -317,6 +1180,131 @@ class UniformTimeSeries(object):
   def __ne__(self, other):
     return not self.__eq__(other)
 
+class RingVariableTimeSeries(VariableTimeSeries):
+  '''
+  This class represents a time series with a variable sampling rate that
+  holds at most a given number of samples (e.g. the last minutes of a live
+  feed), after which appending overwrites the oldest samples. Its memory is
+  fixed when it is created and its data and times are always contiguous
+  arrays, so it otherwise behaves as a VariableTimeSeries. The arrays (and
+  chunks) are views of its buffers, which are only valid until the next
+  append, but slices are copies.
+  '''
+  def __init__(self, capacity, data=[], times=[], offset=0, dtype=np.float32):
+    '''
+    Create a new instance of RingVariableTimeSeries of a given capacity (in
+    samples).
+
+    Raises ValueError if data and times are not of equal length or the
+    capacity is not positive.
+    '''
+    if capacity < 1:
+      raise ValueError('Capacity must be positive.')
+    VariableTimeSeries.__init__(self, data, times, offset, dtype)
+    self._capacity = capacity
+    self._rings = (np.empty(2 * capacity, dtype=self._data.dtype),
+                   np.empty(2 * capacity, dtype=self._times.dtype))
+    self._start = self._end = 0
+    data, times = self._data, self._times
+    self._data = self._times = None
+    self.extend(data, times)
+
+  @property
+  def capacity(self):
+    '''Gets the maximum number of samples held.'''
+    return self._capacity
+
+  @property
+  def data(self):
+    return self._rings[0][self._start:self._end]
+
+  @property
+  def times(self):
+    '''Gets the array of sample times.'''
+    return self._rings[1][self._start:self._end]
+
+  def extend(self, data, times):
+    '''
+    Appends arrays of values and times to this time series, dropping the
+    oldest samples beyond its capacity.
+
+    Raises ValueError if data and times are not equal in length.
+    '''
+    if not (np.isscalar(data) and np.isscalar(times)):
+      # NB: the rings must take the same (scalar or array) path to agree
+      data, times = np.atleast_1d(data), np.atleast_1d(times)
+      if np.size(data) != np.size(times):
+        raise ValueError('Data/times mismatch. Lengths must be equal.')
+
+    layout = extend_ring(self._rings[0], self._start, self._end, data)
+    self._start, self._end = extend_ring(self._rings[1], self._start,
+                                         self._end, times)
+    assert layout == (self._start, self._end)
+    self._summary = None
+    self._pyramid = None
+    self._ftimes = None
+
+  def slice(self, epoch):
+    '''
+    Gets a new instance of VariableTimeSeries for a given epoch (see
+    VariableTimeSeries.slice), which is a copy so that it is not overwritten
+    by later appends.
+    '''
+    return VariableTimeSeries.slice(self, epoch).copy()
+
+class RingUniformTimeSeries(UniformTimeSeries):
+  '''
+  This class represents a time series with uniform data samples that holds
+  at most a given number of samples, after which appending overwrites the
+  oldest samples (and advances the offset). As with RingVariableTimeSeries,
+  slices are copies but the data is a view of its buffer.
+  '''
+  def __init__(self, frequency, capacity, data=[], offset=0, dtype=np.float32,
+               **kwargs):
+    '''
+    Create a new instance of RingUniformTimeSeries of a given capacity (in
+    samples).
+
+    Raises ValueError if the capacity is not positive.
+    '''
+    if capacity < 1:
+      raise ValueError('Capacity must be positive.')
+    UniformTimeSeries.__init__(self, frequency, data, offset, dtype)
+    self._capacity = capacity
+    self._ring = np.empty(2 * capacity, dtype=self._data.dtype)
+    self._start = self._end = 0
+    data, self._data = self._data, None
+    self.extend(data)
+
+  @property
+  def capacity(self):
+    '''Gets the maximum number of samples held.'''
+    return self._capacity
+
+  @property
+  def data(self):
+    return self._ring[self._start:self._end]
+
+  def extend(self, data):
+    '''
+    Appends an array of data samples to this time series, dropping the
+    oldest samples beyond its capacity.
+    '''
+    count = self._end - self._start + np.size(data)
+    self._start, self._end = extend_ring(self._ring, self._start, self._end,
+                                         data)
+    self._offset += (count - len(self)) * self.frequency.interval
+    self._summary = None
+    self._pyramid = None
+
+  def slice(self, epoch):
+    '''
+    Gets a new instance of UniformTimeSeries for a given epoch (see
+    UniformTimeSeries.slice), which is a copy so that it is not overwritten
+    by later appends.
+    '''
+    return UniformTimeSeries.slice(self, epoch).copy()
+
 def time(value, to):
   '''
   Converts a time in BASE_UNITS (currently milliseconds) and converts
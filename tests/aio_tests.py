@@ -0,0 +1,70 @@
+#!/usr/bin/python
+#
+# Author: Martin Galpin (m@66laps.com)
+#
+# Copyright 2007 66laps Limited. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import os
+import numpy as np
+from numpy.testing.utils import assert_array_equal
+
+from openmotorsport.openmotorsport import Session, Channel, Metadata
+from openmotorsport.time import *
+from openmotorsport import aio
+
+class AioTests(unittest.TestCase):
+  def setUp(self):
+    try:
+      aio.executor()
+    except ImportError:
+      self.skipTest('asyncio is not available')
+    self.loop = aio.asyncio.new_event_loop()
+
+  def tearDown(self):
+    self.loop.close()
+
+  def test_aopen(self):
+    path = 'aio.om'
+    session = Session()
+    session.metadata = Metadata(user='Michael Schumacher',
+                                venue={'name': 'Silverstone'},
+                                vehicle={'name': 'Mercedes MGP W01'})
+    session.add_channel(Channel(id=0, name='Channel 1',
+      timeseries=UniformTimeSeries(frequency=Frequency.from_interval(10),
+                                   data=np.arange(1000))
+    ))
+    session.write(path, block_size=300)
+
+    run = self.loop.run_until_complete
+    imported = run(Session.aopen(path, loop=self.loop))
+    try:
+      timeseries = imported.get_channel_by_id(0).timeseries
+      chunks, iterator = [], timeseries.achunks(loop=self.loop)
+      while True:
+        try:
+          chunks.append(run(iterator.__anext__()))
+        except aio.StopAsyncIteration:
+          break
+      self.assertEquals([len(c) for c in chunks], [300, 300, 300, 100])
+      self.assertEquals(chunks[1].offset, 3000)
+      self.assertFalse(timeseries._loaded_data)
+
+      run(timeseries.aload(loop=self.loop))
+      self.assertTrue(timeseries._loaded_data)
+      assert_array_equal(timeseries.data, np.arange(1000))
+    finally:
+      imported.close()
+      os.remove(path)
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+#
+# Author: Martin Galpin (m@66laps.com)
+#
+# Copyright 2007 66laps Limited. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import gc
+import numpy as np
+
+from openmotorsport.cache import ChannelCache
+
+class Owner(object):
+  pass
+
+class ChannelCacheTests(unittest.TestCase):
+  def test_lru(self):
+    cache = ChannelCache(budget=3000)
+    owner = Owner()
+    prefix = cache.key(owner)
+    loads = []
+    def load(name):
+      loads.append(name)
+      return np.zeros(1000, dtype=np.uint8)
+
+    for name in ('a', 'b', 'c', 'a', 'd'):
+      cache.get((prefix, name), lambda: load(name))
+    self.assertEquals(loads, ['a', 'b', 'c', 'd'])
+    self.assertEquals((cache.hits, cache.misses, cache.evictions), (1, 4, 1))
+    self.assertEquals(cache.size, 3000)
+    # 'b' was the least recently used
+    self.assertFalse((prefix, 'b') in cache)
+    self.assertTrue((prefix, 'a') in cache)
+
+    cache.budget = 1000
+    self.assertEquals(cache.evictions, 3)
+    self.assertTrue((prefix, 'd') in cache)
+
+    # an array larger than the budget is returned but not held
+    self.assertEquals(len(cache.get((prefix, 'e'),
+                                    lambda: np.zeros(2000, np.uint8))), 2000)
+    self.assertEquals(cache.size, 0)
+
+  def test_release(self):
+    cache = ChannelCache()
+    owner = Owner()
+    prefix = cache.key(owner)
+    cache.get((prefix, 'a'), lambda: np.zeros(10))
+    cache.discard(prefix, 'a')
+    self.assertEquals(cache.size, 0)
+
+    cache.get((prefix, 'a'), lambda: np.zeros(10))
+    del owner
+    gc.collect()
+    cache.get((cache.key(Owner()), 'b'), lambda: np.zeros(0))
+    self.assertFalse((prefix, 'a') in cache)
+    self.assertEquals(cache.size, 0)
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+#
+# Author: Martin Galpin (m@66laps.com)
+#
+# Copyright 2007 66laps Limited. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from datetime import datetime
+import os, shutil, tempfile
+import numpy as np
+
+from openmotorsport.openmotorsport import Session, Channel, Metadata
+from openmotorsport.catalog import Catalog
+from openmotorsport.time import *
+
+class CatalogTests(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def test_index(self):
+    first = self._write_session('first.om', 'Silverstone', [10.0, 70.0, 125.0])
+    second = self._write_session('second.om', 'Brands Hatch', [5.0, 50.0])
+    open(os.path.join(self.directory, 'broken.om'), 'wb').write('not a zip')
+
+    with Catalog(':memory:') as catalog:
+      indexed, failed = catalog.index(self.directory)
+      self.assertEquals(sorted(indexed), [first, second])
+      self.assertEquals(failed, [os.path.join(self.directory, 'broken.om')])
+
+      self.assertEquals(catalog.sessions(venue='Silverstone'), [first])
+      self.assertEquals(catalog.sessions(channel='Speed'), [second, first])
+      self.assertEquals(catalog.sessions(channel='Throttle'), [])
+      self.assertEquals(catalog.sessions(date_from=datetime(2010, 6, 2)),
+                        [first])
+      self.assertRaises(TypeError, catalog.sessions, colour='red')
+
+      self.assertEquals(catalog.laps(min_length=40.0, max_length=58.0),
+                        [(second, 1, 45.0), (first, 2, 55.0)])
+      self.assertEquals(catalog.laps(venue='Silverstone'),
+                        [(first, 0, 10.0), (first, 2, 55.0), (first, 1, 60.0)])
+      self.assertEquals(catalog.sectors(first, 1), [])
+      self.assertEquals(catalog.channels(second),
+                        [(0, 'Speed', 'Vehicle', 'km/h', 10)])
+
+      # unchanged files are skipped and removed files are dropped
+      self.assertEquals(catalog.index(self.directory)[0], [])
+      os.remove(second)
+      catalog.index(self.directory)
+      self.assertEquals(catalog.sessions(), [first])
+
+      # indexing with another pattern keeps the files of the first
+      other = self._write_session('other.omx', 'Oulton Park', [5.0])
+      self.assertEquals(catalog.index(self.directory, '*.omx')[0], [other])
+      self.assertEquals(catalog.sessions(), [first, other])
+      os.remove(other)
+      catalog.index(self.directory, '*.omx')
+      self.assertEquals(catalog.sessions(), [first])
+
+      # changed files are re-indexed
+      self._write_session('first.om', 'Donington', [10.0, 70.0])
+      os.utime(first, (0, 0))
+      self.assertEquals(catalog.index(self.directory)[0], [first])
+      self.assertEquals(catalog.sessions(venue='Silverstone'), [])
+      self.assertEquals(catalog.laps(), [(first, 0, 10.0), (first, 1, 60.0)])
+
+  def _write_session(self, name, venue, markers):
+    path = os.path.join(self.directory, name)
+    session = Session()
+    session.metadata = Metadata(
+      user='Michael Schumacher',
+      venue={'name': venue},
+      vehicle={'name': 'Mercedes MGP W01'},
+      date=datetime(2010, 6, 1 + len(markers) % 2),
+      datasource='python-openmotorsport'
+    )
+    session.num_sectors = 0
+    [session.add_marker(m) for m in markers]
+    session.add_channel(Channel(id=0, name='Speed', group='Vehicle',
+      units='km/h', timeseries=UniformTimeSeries(
+        frequency=Frequency.from_interval(10),
+        data=np.arange(100, dtype=np.float32)
+      )
+    ))
+    session.write(path)
+    return path
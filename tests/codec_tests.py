@@ -0,0 +1,75 @@
+#!/usr/bin/python
+#
+# Author: Martin Galpin (m@66laps.com)
+#
+# Copyright 2007 66laps Limited. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import zipfile
+import numpy as np
+from numpy.testing.utils import assert_array_equal
+
+from openmotorsport.codec import *
+
+class CodecTests(unittest.TestCase):
+  def test_parse(self):
+    self.assertEquals(repr(Codec()), 'deflate')
+    self.assertEquals(repr(Codec('delta')), 'delta,deflate')
+    self.assertEquals(repr(Codec('delta2, deflate:9')), 'delta2,deflate:9')
+    self.assertEquals(repr(Codec('shuffle,bz2')), 'shuffle,bz2')
+    self.assertEquals(Codec('bz2:9'), Codec('bz2'))
+    self.assertEquals(Codec('none').compress_type, zipfile.ZIP_STORED)
+    self.assertEquals(Codec('deflate:1').compress_type, zipfile.ZIP_DEFLATED)
+    self.assertTrue(Codec('deflate:1').is_raw)
+    self.assertFalse(Codec('shuffle,none').is_raw)
+    self.assertRaises(ValueError, Codec, 'foo')
+    self.assertRaises(ValueError, Codec, 'foo,deflate')
+
+  def test_round_trip(self):
+    times = np.cumsum(np.random.randint(1, 50, 1000)).astype(np.uint32)
+    data = np.random.random(1000).astype(np.float32)
+    for spec in ['deflate', 'none', 'bz2', 'delta', 'delta2,bz2:1',
+                 'shuffle,delta,none']:
+      codec = Codec(spec)
+      assert_array_equal(codec.decode(codec.encode(times), np.uint32), times)
+      if 'delta' not in spec:
+        assert_array_equal(codec.decode(codec.encode(data), np.float32), data)
+
+    codec = Codec('delta2')
+    self.assertRaises(ValueError, codec.encode, data)
+    assert_array_equal(codec.encode(np.arange(0, 50, 5, dtype=np.uint32)),
+                       [0, 5] + [0] * 8)
+    empty = np.array([], dtype=np.uint32)
+    assert_array_equal(codec.decode(codec.encode(empty), np.uint32), empty)
+
+  def test_encoder(self):
+    times = np.cumsum(np.random.randint(1, 50, 1000)).astype(np.uint32)
+    for spec in ['deflate', 'none', 'bz2', 'delta', 'delta2,bz2:1']:
+      codec = Codec(spec)
+      encoder = codec.encoder()
+      entry = ''.join([encoder.encode(times[i:i + 70])
+                       for i in range(0, 1000, 70)]) + encoder.flush()
+      raw = np.frombuffer(entry, dtype=np.uint8)
+      assert_array_equal(codec.decode(raw, np.uint32), times)
+
+    self.assertTrue(Codec('delta,bz2').is_streamable)
+    self.assertFalse(Codec('shuffle,bz2').is_streamable)
+    self.assertRaises(ValueError, Codec('shuffle').encoder)
+    encoder = Codec('delta').encoder()
+    encoder.encode(np.arange(3, dtype=np.uint32))
+    self.assertRaises(ValueError, encoder.encode, np.zeros(3))
+
+if __name__ == '__main__':
+  unittest.main()
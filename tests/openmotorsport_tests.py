@@ -18,10 +18,14 @@
 
 import unittest
 from datetime import datetime
-import os, tempfile, zipfile
+import os, mmap, tempfile, zipfile
+from StringIO import StringIO
 
-from openmotorsport.openmotorsport import Session, Channel, Metadata, Lap
+from openmotorsport.openmotorsport import Session, SessionWriter, Channel, Metadata, Lap
 from openmotorsport.time import *
+from openmotorsport.cache import CACHE
+from openmotorsport import load_many
+from numpy.testing.utils import assert_array_equal
 
 class SessionTests(unittest.TestCase):
   
@@ -57,6 +61,13 @@ class SessionTests(unittest.TestCase):
     session.add_marker(10)
     session.add_marker(20)
     self.assertEquals(len(session.laps), 2)
+
+  def testAddMarkers(self):
+    session = Session()
+    session.add_marker(10)
+    session.add_markers([20, 30.5])
+    session.add_markers([])
+    assert_array_equal(session.markers, [10, 20, 30.5])
     
   def testWriteWithData(self):
     path = 'test_data.om'
@@ -426,6 +437,626 @@ class SessionTests(unittest.TestCase):
       
     os.remove(path)
 
+  def test_read_channel_in_memory(self):
+    path = 'in_memory.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='Channel 1',
+      timeseries=VariableTimeSeries(data=self._getSampleData(),
+                                    times=range(0, 10))
+    ))
+    session.write(path)
+
+    with Session(path) as imported:
+      timeseries = imported.get_channel_by_id(0).timeseries
+      assert_array_equal(timeseries.data, self._getSampleData())
+      assert_array_equal(timeseries.times, range(0, 10))
+      self.assertEquals(timeseries.data.dtype, np.float32)
+      self.assertEquals(timeseries.times.dtype, np.uint32)
+      self.assertTrue(timeseries.data.flags.writeable)
+      self.assertFalse(hasattr(imported, '_tempdir'))
+    os.remove(path)
+
+  def test_write_stored(self):
+    path = 'stored.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='Channel 1',
+      timeseries=UniformTimeSeries(frequency=Frequency.from_interval(1),
+                                   data=self._getSampleData())
+    ))
+    session.add_channel(Channel(id=1, name='Channel 2',
+      timeseries=VariableTimeSeries(data=self._getSampleData(),
+                                    times=range(0, 10))
+    ))
+    session.write(path, compression=zipfile.ZIP_STORED)
+
+    with Session(path) as imported:
+      uniform = imported.get_channel_by_id(0).timeseries
+      variable = imported.get_channel_by_id(1).timeseries
+      self.assertTrue(isinstance(uniform.data, np.memmap))
+      self.assertTrue(isinstance(variable.data, np.memmap))
+      self.assertTrue(isinstance(variable.times, np.memmap))
+      self.assertEquals(imported, session)
+    os.remove(path)
+
+  def test_write_streaming(self):
+    path = 'streaming.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='Channel 1',
+      timeseries=UniformTimeSeries(frequency=Frequency.from_interval(1),
+                                   data=get_data(interval=1, duration=600.0))
+    ))
+
+    def mkstemp(*args, **kwargs):
+      self.fail('Session.write should not create temporary files.')
+    original_mkstemp, tempfile.mkstemp = tempfile.mkstemp, mkstemp
+    try:
+      session.write(path)
+    finally:
+      tempfile.mkstemp = original_mkstemp
+
+    archive = zipfile.ZipFile(path)
+    self.assertEquals(archive.testzip(), None)
+    self.assertEquals(archive.getinfo('data/0.bin').file_size, 600000 * 4)
+    archive.close()
+
+    with Session(path) as imported:
+      self.assertEquals(imported, session)
+    os.remove(path)
+
+  def test_write_workers(self):
+    path = 'workers.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    for id in range(0, 5):
+      session.add_channel(Channel(id=id, name='Channel %d' % id,
+        timeseries=VariableTimeSeries(data=get_data(1, 10.0) * id,
+                                      times=range(0, 10000))
+      ))
+    session.write(path, workers=3)
+
+    archive = zipfile.ZipFile(path)
+    self.assertEquals(archive.testzip(), None)
+    self.assertEquals(len(archive.namelist()), 11)
+    archive.close()
+
+    with Session(path) as imported:
+      self.assertEquals(imported, session)
+    os.remove(path)
+
+  def test_write_blocks(self):
+    path = 'blocks.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='Channel 1',
+      timeseries=UniformTimeSeries(frequency=Frequency.from_interval(10),
+                                   data=get_data(interval=10, duration=100.0))
+    ))
+    session.add_channel(Channel(id=1, name='Channel 2',
+      timeseries=VariableTimeSeries(data=get_data(interval=10, duration=100.0),
+                                    times=range(0, 100000, 10))
+    ))
+    session.add_channel(Channel(id=2, name='Channel 3',
+      timeseries=VariableTimeSeries()
+    ))
+    session.write(path, block_size=1000)
+
+    archive = zipfile.ZipFile(path)
+    self.assertTrue('data/0/9.bin' in archive.namelist())
+    self.assertTrue('data/1/9.tms' in archive.namelist())
+    self.assertFalse('data/0.bin' in archive.namelist())
+    archive.close()
+
+    epochs = [Epoch(offset=0, length=100), Epoch(offset=9995, length=20),
+              Epoch(offset=43210, length=12345)]
+    with Session(path) as imported:
+      for epoch in epochs:
+        for id in (0, 1):
+          original = session.get_channel_by_id(id).timeseries.slice(epoch)
+          sliced = imported.slice(epoch, [id])[id]
+          assert_array_equal(sliced.data, original.data)
+          assert_array_equal(sliced.times, original.times)
+      self.assertFalse(imported.get_channel_by_id(0).timeseries._loaded_data)
+      self.assertFalse(imported.get_channel_by_id(1).timeseries._loaded_data)
+      self.assertRaises(ValueError, imported.get_channel_by_id(1).timeseries.slice,
+                        Epoch(offset=0, length=100000))
+      self.assertEquals(imported, session)
+    os.remove(path)
+
+  def test_write_codecs(self):
+    path = 'codecs.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='Channel 1', codec='shuffle,bz2',
+      timeseries=VariableTimeSeries(data=get_data(interval=10, duration=100.0),
+                                    times=range(0, 100000, 10))
+    ))
+    session.add_channel(Channel(id=1, name='Channel 2',
+      timeseries=VariableTimeSeries(data=get_data(interval=10, duration=100.0),
+                                    times=range(0, 100000, 10))
+    ))
+
+    for kwargs in [{}, {'workers': 2}, {'block_size': 1000}]:
+      session.write(path, times_codec='delta2,deflate:9', **kwargs)
+      with Session(path) as imported:
+        self.assertEquals(repr(imported.get_channel_by_id(0).codec),
+                          'shuffle,bz2')
+        self.assertEquals(repr(imported.get_channel_by_id(1).times_codec),
+                          'delta2,deflate:9')
+        self.assertEquals(imported.get_channel_by_id(1).codec, None)
+        self.assertEquals(imported, session)
+      os.remove(path)
+
+  def test_open_header(self):
+    path = 'header.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.metadata.duration = 75
+    session.num_sectors = 1
+    [session.add_marker(m) for m in [10.0, 30.0, 40.0, 70.0]]
+    session.add_channel(Channel(id=0, name='Channel 1', group='Group 1',
+      timeseries=VariableTimeSeries(data=self._getSampleData(),
+                                    times=range(0, 10))
+    ))
+    session.write(path)
+
+    header = Session.open_header(path)
+    self.assertEquals(header.metadata, session.metadata)
+    self.assertEquals(header.metadata.duration, 75)
+    self.assertEquals(header.num_sectors, 1)
+    assert_array_equal(header.markers, session.markers)
+    self.assertEquals(header.laps, session.laps)
+    self.assertEquals(len(header.channels), 0)
+    self.assertEquals(header._zipfile, None)
+
+    # parsing stops before the channels are reached, so it succeeds even
+    # when meta.xml is cut off at the first channel
+    archive = zipfile.ZipFile(path)
+    meta = archive.read('meta.xml')
+    archive.close()
+    self.assertTrue(meta.index('<markers') < meta.index('<channels'))
+    header = Session()
+    header._parse_header(StringIO(meta[:meta.index('<channel ')]))
+    self.assertEquals(header.metadata, session.metadata)
+    assert_array_equal(header.markers, session.markers)
+    os.remove(path)
+
+  def test_preload(self):
+    path = 'preload.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    for id in range(0, 8):
+      session.add_channel(Channel(id=id, name='Channel %d' % id,
+        timeseries=VariableTimeSeries(data=self._getSampleData() * id,
+                                      times=range(0, 10))
+      ))
+    session.write(path)
+
+    with Session(path) as imported:
+      imported.preload([1, 2], workers=2)
+      self.assertTrue(imported.get_channel_by_id(1).timeseries._loaded_data)
+      self.assertTrue(imported.get_channel_by_id(2).timeseries._loaded_times)
+      self.assertFalse(imported.get_channel_by_id(3).timeseries._loaded_data)
+
+      imported.preload(workers=4)
+      for channel in imported.channels:
+        self.assertTrue(channel.timeseries._loaded_data)
+        self.assertTrue(channel.timeseries._loaded_times)
+      self.assertEquals(imported, session)
+      self.assertRaises(KeyError, imported.preload, [100])
+    os.remove(path)
+
+  def test_session_writer(self):
+    path = 'writer.om'
+    writer = SessionWriter(path, metadata=self._getSampleMeta(),
+                           num_sectors=0, buffer_size=100)
+    writer.add_channel(Channel(id=0, name='Channel 1',
+      timeseries=UniformTimeSeries(frequency=Frequency.from_interval(10))
+    ))
+    writer.add_channel(Channel(id=1, name='Channel 2', group='Group 1',
+      timeseries=VariableTimeSeries(), times_codec='delta,bz2'
+    ))
+    writer.add_channel(Channel(id=2, name='Channel 3',
+      timeseries=VariableTimeSeries()
+    ))
+    self.assertRaises(ValueError, writer.add_channel, Channel(id=3,
+      name='Channel 4', timeseries=VariableTimeSeries(), codec='shuffle,bz2'))
+    for chunk in range(0, 10):
+      samples = np.arange(chunk * 30, (chunk + 1) * 30, dtype=np.float32)
+      writer.append(0, samples)
+      writer.append(1, samples, samples.astype(np.uint32) * 5)
+      writer.add_marker(chunk * 300)
+    self.assertTrue(len(writer.session.get_channel_by_id(0).timeseries) < 100)
+    writer.close()
+    self.assertEquals(os.listdir('.').count(path), 1)
+    self.assertFalse([f for f in os.listdir('.') if f.startswith('.' + path)])
+
+    with Session(path) as imported:
+      self.assertEquals(imported.metadata, self._getSampleMeta())
+      self.assertEquals(imported.metadata.duration, 3000)
+      assert_array_equal(imported.markers, np.arange(0, 3000, 300))
+      assert_array_equal(imported.get_channel_by_id(0).timeseries.data,
+                         np.arange(0, 300))
+      assert_array_equal(imported.get_channel_by_id(1).timeseries.times,
+                         np.arange(0, 1500, 5))
+      self.assertEquals(imported.get_channel_by_id(1).group, 'Group 1')
+      self.assertEquals(len(imported.get_channel_by_id(2).timeseries), 0)
+    os.remove(path)
+
+  def test_summary(self):
+    path = 'summary.om'
+    data = self._getSampleData()
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='Channel 1',
+      timeseries=VariableTimeSeries(data=data, times=range(5, 15))
+    ))
+    session.add_channel(Channel(id=1, name='Channel 2',
+      timeseries=UniformTimeSeries(frequency=Frequency.from_interval(10),
+                                   data=data)
+    ))
+    session.add_channel(Channel(id=2, name='Channel 3'))
+    session.write(path)
+
+    with Session(path) as imported:
+      for id in (0, 1):
+        channel = imported.get_channel_by_id(id)
+        self.assertAlmostEquals(channel.min, np.min(data))
+        self.assertAlmostEquals(channel.max, np.max(data))
+        self.assertAlmostEquals(channel.average, np.average(data))
+        self.assertEquals(channel.summary.count, 10)
+        self.assertFalse(channel.timeseries._loaded_data)
+      self.assertEquals(imported.get_channel_by_id(0).summary.first_time, 5)
+      self.assertEquals(imported.get_channel_by_id(1).summary.last_time, 90)
+      self.assertEquals(imported.get_channel_by_id(2).timeseries._summary, None)
+    os.remove(path)
+
+    # summaries are accumulated as samples are spooled
+    writer = SessionWriter(path, metadata=self._getSampleMeta(), buffer_size=4)
+    writer.add_channel(Channel(id=0, name='Channel 1',
+      timeseries=UniformTimeSeries(frequency=Frequency.from_interval(10))
+    ))
+    [writer.append(0, x) for x in data]
+    writer.close()
+    with Session(path) as imported:
+      summary = imported.get_channel_by_id(0).summary
+      self.assertEquals(summary.count, 10)
+      self.assertAlmostEquals(summary.mean, np.mean(data))
+      self.assertAlmostEquals(summary.sum_squares, np.sum(data ** 2), 5)
+      self.assertEquals((summary.first_time, summary.last_time), (0, 90))
+    os.remove(path)
+
+  def test_write_envelopes(self):
+    path = 'envelopes.om'
+    data = np.sin(np.arange(5000) / 50.0).astype(np.float32)
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='Channel 1',
+      timeseries=UniformTimeSeries(frequency=Frequency.from_interval(10),
+                                   data=data)
+    ))
+    session.add_channel(Channel(id=1, name='Channel 2',
+      timeseries=VariableTimeSeries(data=data, times=np.arange(5000) * 3)
+    ))
+    session.write(path, envelopes=True)
+
+    with Session(path) as imported:
+      for id in (0, 1):
+        original = session.get_channel_by_id(id).timeseries
+        timeseries = imported.get_channel_by_id(id).timeseries
+        epoch = Epoch(20000, 1000)
+        for actual, expected in zip(timeseries.envelope(epoch, 200),
+                                    original.envelope(epoch, 200)):
+          assert_array_equal(actual, expected)
+        self.assertFalse(timeseries._loaded_data)
+    os.remove(path)
+
+    # zoomed in on a channel written in blocks, only the samples are read
+    session.write(path, block_size=300, envelopes=True)
+    with Session(path) as imported:
+      for id in (0, 1):
+        original = session.get_channel_by_id(id).timeseries
+        timeseries = imported.get_channel_by_id(id).timeseries
+        for epoch in [Epoch(20000, 1000), Epoch(20, 2990), Epoch(0, 0),
+                      Epoch(30, 890), Epoch(100, 14990), Epoch(100, 49950)]:
+          for actual, expected in zip(timeseries.envelope(epoch, 200),
+                                      original.envelope(epoch, 200)):
+            assert_array_equal(actual, expected)
+        self.assertFalse(timeseries._loaded_data)
+      self.assertFalse(imported.get_channel_by_id(1).timeseries._loaded_times)
+    os.remove(path)
+
+  def test_cache(self):
+    path = 'cache.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    for id in range(0, 4):
+      session.add_channel(Channel(id=id, name='Channel %d' % id,
+        timeseries=UniformTimeSeries(frequency=Frequency.from_interval(10),
+                                     data=np.arange(1000) * id)
+      ))
+    session.write(path)
+
+    budget = CACHE.budget
+    CACHE.budget = 8000
+    CACHE.clear()
+    try:
+      with Session(path) as imported:
+        evictions = CACHE.evictions
+        for id in range(0, 4):
+          assert_array_equal(imported.get_channel_by_id(id).timeseries.data,
+                             np.arange(1000) * id)
+        self.assertEquals(CACHE.evictions - evictions, 2)
+        self.assertFalse(imported.get_channel_by_id(0).timeseries._loaded_data)
+        self.assertTrue(imported.get_channel_by_id(3).timeseries._loaded_data)
+
+        # evicted data is read again, and appended data is never evicted
+        timeseries = imported.get_channel_by_id(0).timeseries
+        timeseries.append([1000])
+        for channel in imported.channels:
+          channel.timeseries.data
+        self.assertEquals(len(timeseries.data), 1001)
+        self.assertEquals(timeseries.data[-1], 1000)
+    finally:
+      CACHE.budget = budget
+    os.remove(path)
+
+  def test_load_many(self):
+    paths = ['many%d.om' % i for i in range(0, 5)]
+    for i, path in enumerate(paths):
+      session = Session()
+      session.metadata = self._getSampleMeta()
+      for id in range(0, 3):
+        session.add_channel(Channel(id=id, name='Channel %d' % id,
+          timeseries=VariableTimeSeries(data=self._getSampleData() * i,
+                                        times=range(0, 10))
+        ))
+      session.write(path)
+
+    loaded = dict(load_many(paths, channels=[1], workers=3))
+    self.assertEquals(sorted(loaded.keys()), paths)
+    for i, path in enumerate(paths):
+      self.assertEquals([c.id for c in loaded[path].channels], [1])
+      self.assertTrue(loaded[path].get_channel_by_id(1).timeseries._loaded_data)
+      loaded[path].close()
+
+    for path, arrays in load_many(paths, workers=2, arrays=True):
+      i = paths.index(path)
+      self.assertEquals(sorted(arrays.keys()), [0, 1, 2])
+      assert_array_equal(arrays[2][0], range(0, 10))
+      assert_array_equal(arrays[2][1], self._getSampleData() * i)
+
+    self.assertRaises(Exception, list, load_many(paths + ['missing.om']))
+    [os.remove(path) for path in paths]
+
+  def test_write_dtypes(self):
+    path = 'dtypes.om'
+    adc = np.arange(0, 4096, 16) * 0.05 - 10.0
+    latitude = 51.0 + np.arange(256) * 1e-7
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='ADC', dtype='int16', scale=0.05,
+      add_offset=-10.0, timeseries=UniformTimeSeries(
+        frequency=Frequency.from_interval(10), data=adc)
+    ))
+    session.add_channel(Channel(id=1, name='Latitude',
+      timeseries=VariableTimeSeries(data=latitude, times=range(0, 256),
+                                    dtype=np.float64)
+    ))
+    session.add_channel(Channel(id=2, name='Half', dtype='float16',
+      timeseries=VariableTimeSeries(data=[0.5, 1.5], times=[0, 1])
+    ))
+    session.write(path, block_size=100)
+    self.assertRaises(ValueError, Channel, id=3, dtype='complex64')
+
+    archive = zipfile.ZipFile(path)
+    self.assertEquals(archive.getinfo('data/0/0.bin').file_size, 200)
+    self.assertEquals(archive.getinfo('data/1/0.bin').file_size, 800)
+    archive.close()
+
+    with Session(path) as imported:
+      channel = imported.get_channel_by_id(0)
+      self.assertEquals(channel.dtype, np.int16)
+      self.assertEquals((channel.scale, channel.add_offset), (0.05, -10.0))
+      self.assertEquals(channel.timeseries.raw.dtype, np.int16)
+      assert_array_equal(channel.timeseries.raw, np.arange(0, 4096, 16))
+      self.assertEquals(channel.timeseries.data.dtype, np.float32)
+      self.assertTrue(np.allclose(channel.timeseries.data, adc, atol=1e-4))
+      sliced = channel.timeseries.slice(Epoch(500, 1000))
+      self.assertTrue(np.allclose(sliced.data, adc[100:150], atol=1e-4))
+
+      channel = imported.get_channel_by_id(1)
+      self.assertEquals(channel.timeseries.data.dtype, np.float64)
+      assert_array_equal(channel.timeseries.data, latitude)
+      assert_array_equal(channel.timeseries.slice(Epoch(10, 150)).data,
+                         latitude[150:161])
+      assert_array_equal(imported.get_channel_by_id(2).timeseries.data,
+                         [0.5, 1.5])
+    os.remove(path)
+
+    writer = SessionWriter(path, metadata=self._getSampleMeta(), buffer_size=100)
+    writer.add_channel(Channel(id=0, name='ADC', dtype='uint8', scale=0.5,
+      timeseries=UniformTimeSeries(frequency=Frequency.from_interval(10))
+    ))
+    [writer.append(0, np.arange(0, 100, 0.5)) for i in range(0, 3)]
+    writer.close()
+    with Session(path) as imported:
+      timeseries = imported.get_channel_by_id(0).timeseries
+      assert_array_equal(timeseries.raw, np.tile(np.arange(0, 200), 3))
+      assert_array_equal(timeseries.data, np.tile(np.arange(0, 100, 0.5), 3))
+    os.remove(path)
+
+  def test_write_float_scale(self):
+    path = 'scale.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='Default', scale=0.1,
+      timeseries=UniformTimeSeries(Frequency(10), [1, 2, 3])))
+    session.add_channel(Channel(id=1, name='Offset', dtype='float32',
+      add_offset=5.0, timeseries=UniformTimeSeries(Frequency(10), [1, 2, 3])))
+    session.add_channel(Channel(id=2, name='Double', dtype='float64',
+      scale=2.0, timeseries=UniformTimeSeries(Frequency(10), [1, 2, 3],
+                                              dtype=np.float64)))
+    session.add_channel(Channel(id=3, name='Clipped', dtype='uint8',
+      scale=1.0, timeseries=UniformTimeSeries(Frequency(10), [-5, 2.4, 300])))
+    session.write(path)
+
+    with Session(path) as imported:
+      for id in range(0, 3):
+        timeseries = imported.get_channel_by_id(id).timeseries
+        self.assertTrue(np.allclose(timeseries.data, [1, 2, 3]))
+      assert_array_equal(imported.get_channel_by_id(1).timeseries.raw,
+                         [-4, -3, -2])
+      # the summary is of the values as they load back
+      timeseries = imported.get_channel_by_id(3).timeseries
+      assert_array_equal(timeseries.data, [0, 2, 255])
+      self.assertEquals((timeseries.min, timeseries.max), (0, 255))
+      self.assertAlmostEquals(timeseries.mean, 257 / 3.0, 5)
+    os.remove(path)
+
+  def test_chunks(self):
+    path = 'chunks.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='Channel 1',
+      timeseries=VariableTimeSeries(data=np.arange(250), times=np.arange(250) * 2)
+    ))
+    session.write(path, block_size=100)
+
+    chunks = list(session.get_channel_by_id(0).timeseries.chunks(50))
+    self.assertEquals([len(c) for c in chunks], [50] * 5)
+    with Session(path) as imported:
+      chunks = list(imported.get_channel_by_id(0).timeseries.chunks())
+      self.assertEquals([len(c) for c in chunks], [100, 100, 50])
+      assert_array_equal(chunks[2].times, np.arange(200, 250) * 2)
+      assert_array_equal(np.concatenate([c.data for c in chunks]),
+                         np.arange(250))
+    os.remove(path)
+
+  def test_file_objects(self):
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    for id in range(0, 3):
+      session.add_channel(Channel(id=id, name='Channel %d' % id,
+        timeseries=VariableTimeSeries(data=self._getSampleData() * id,
+                                      times=range(0, 10))
+      ))
+
+    # a seekable stream
+    stream = StringIO()
+    self.assertEquals(session.write(stream, zipfile.ZIP_STORED), stream)
+    loaded = Session(StringIO(stream.getvalue()))
+    self.assertEquals(loaded, session)
+    loaded.preload(workers=2)
+    assert_array_equal(loaded.get_channel_by_id(2).timeseries.data,
+                       self._getSampleData() * 2)
+    loaded.close()
+
+    # an unseekable stream (e.g. a socket or pipe)
+    class Unseekable(object):
+      def __init__(self):
+        self.buffer = StringIO()
+      def write(self, data):
+        self.buffer.write(data)
+      def tell(self):
+        raise IOError('Illegal seek')
+      def flush(self):
+        pass
+    unseekable = Unseekable()
+    session.write(unseekable)
+    archive = zipfile.ZipFile(StringIO(unseekable.buffer.getvalue()))
+    self.assertEquals(archive.testzip(), None)
+    archive.close()
+    loaded = Session(StringIO(unseekable.buffer.getvalue()))
+    self.assertEquals(loaded, session)
+    loaded.close()
+
+    # a memory mapped file
+    path = 'mapped.om'
+    open(path, 'wb').write(stream.getvalue())
+    f = open(path, 'rb')
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    loaded = Session(mapped)
+    timeseries = loaded.get_channel_by_id(1).timeseries
+    assert_array_equal(timeseries.data, self._getSampleData())
+    self.assertEquals(loaded, session)
+    loaded.close()
+    mapped.close()
+    f.close()
+    os.remove(path)
+    # the data does not refer to the closed mapping
+    assert_array_equal(timeseries.data, self._getSampleData())
+
+  def test_to_matrix(self):
+    path = 'matrix.om'
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='Uniform',
+      timeseries=UniformTimeSeries(Frequency(100), np.arange(10) * 2.0)))
+    session.add_channel(Channel(id=1, name='Variable',
+      timeseries=VariableTimeSeries([5, 10, 30], [20, 40, 80])))
+    session.write(path)
+
+    with Session(path) as imported:
+      times, matrix = imported.to_matrix(frequency=Frequency(50))
+      assert_array_equal(times, [0, 20, 40, 60, 80])
+      self.assertEquals(matrix.shape, (5, 2))
+      assert_array_equal(matrix[:, 0], [0, 4, 8, 12, 16])
+      assert_array_equal(matrix[:, 1], [np.nan, 5, 10, 20, 30])
+
+      times, matrix = imported.to_matrix([1, 0], times=[30, 90])
+      assert_array_equal(matrix, [[7.5, 6], [np.nan, 18]])
+
+      times, matrix = imported.to_matrix(frequency=Frequency(100),
+                                         epoch=Epoch(30, 20))
+      assert_array_equal(times, [20, 30, 40])
+      assert_array_equal(matrix[:, 0], [4, 6, 8])
+
+      # into a caller supplied buffer
+      out = np.zeros((2, 1), dtype=np.float32)
+      times, matrix = imported.to_matrix([0], times=[5, 15], out=out)
+      self.assertTrue(matrix is out)
+      assert_array_equal(out, [[1], [3]])
+      self.assertRaises(ValueError, imported.to_matrix, [0], times=[5],
+                        out=out)
+      self.assertRaises(ValueError, imported.to_matrix)
+      self.assertRaises(KeyError, imported.to_matrix, [7], times=[0])
+    os.remove(path)
+
+    # the offset of a uniform channel is written and restored
+    session = Session()
+    session.metadata = self._getSampleMeta()
+    session.add_channel(Channel(id=0, name='Uniform',
+      timeseries=UniformTimeSeries(Frequency(100), np.arange(10) * 2.0,
+                                   offset=500)))
+    session.add_channel(Channel(id=1, name='Variable',
+      timeseries=VariableTimeSeries([5, 10, 30], [520, 540, 580])))
+    expected = session.to_matrix(frequency=Frequency(50))
+    for kwargs in [{}, {'block_size': 4}]:
+      session.write(path, **kwargs)
+      with Session(path) as imported:
+        timeseries = imported.get_channel_by_id(0).timeseries
+        self.assertEquals(timeseries.offset, 500)
+        self.assertEquals(timeseries.summary.first_time, 500)
+        actual = imported.to_matrix(frequency=Frequency(50))
+        assert_array_equal(actual[0], expected[0])
+        assert_array_equal(actual[1], expected[1])
+        assert_array_equal(timeseries.slice(Epoch(20, 520)).data, [4, 6])
+      os.remove(path)
+
+    writer = SessionWriter(path, metadata=self._getSampleMeta(), buffer_size=4)
+    writer.add_channel(Channel(id=0, name='Uniform',
+      timeseries=UniformTimeSeries(Frequency(100), offset=500)))
+    [writer.append(0, x) for x in np.arange(10) * 2.0]
+    writer.close()
+    with Session(path) as imported:
+      times, matrix = imported.to_matrix(frequency=Frequency(50))
+      assert_array_equal(times, expected[0])
+      assert_array_equal(matrix[:, 0], expected[1][:, 0])
+    os.remove(path)
+
   def test_import_errors(self):
     path = tempfile.mkstemp()[1]
     self.assertRaises(Exception, Session, path)
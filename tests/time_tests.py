@@ -19,8 +19,10 @@
 # limitations under the License.
 
 import unittest
+import numpy as np
 from openmotorsport.time import *
-from numpy.testing.utils import assert_array_equal
+from numpy.testing.utils import assert_array_equal, \
+  assert_array_almost_equal
 
 class FrequencyTests(unittest.TestCase):
   def test_frequency(self):
@@ -30,6 +32,13 @@ class FrequencyTests(unittest.TestCase):
     self.assertEquals(f.__repr__(), '5Hz')
     self.assertEquals(f, Frequency.from_interval(200))
 
+    # intervals are not truncated
+    f = Frequency(120)
+    self.assertAlmostEquals(f.interval, 1000 / 120.0)
+    self.assertEquals(Frequency.from_interval(repr(f.interval)), f)
+    self.assertEquals(Frequency.from_interval('10').frequency, 100)
+    self.assertEquals(Frequency(3).__repr__(), '3Hz')
+
 class VariableTimeSeriesTests(unittest.TestCase):
   def test_VariableTimeSeries(self):
     ts = VariableTimeSeries()
@@ -63,6 +72,8 @@ class VariableTimeSeriesTests(unittest.TestCase):
     self.assertEquals(ts.index_at(3), 2)
     self.assertEquals(ts.index_at(1.5), 1)
     self.assertRaises(ValueError, ts.index_at, 3.5)
+    assert_array_equal(ts.indices_at([0, 1.5, 3]), [0, 1, 2])
+    self.assertRaises(ValueError, ts.indices_at, [1, 4])
 
   def test_append(self):
     ts = VariableTimeSeries([1,2,3], [1,2,3])
@@ -84,6 +95,36 @@ class VariableTimeSeriesTests(unittest.TestCase):
 
     self.assertRaises(ValueError, ts.append, [1,2,3], [])
 
+  def test_extend(self):
+    ts = VariableTimeSeries([1,2], [10,20])
+    data = ts.data
+    for i in range(3, 100):
+      ts.append(i, i * 10)
+    ts.extend([100, 101], [1000, 1010])
+    assert_array_equal(ts.data, range(1, 102))
+    assert_array_equal(ts.times, np.arange(1, 102) * 10)
+    self.assertEquals(ts.times.dtype, np.uint32)
+    # earlier views are unchanged
+    assert_array_equal(data, [1, 2])
+    self.assertRaises(ValueError, ts.extend, [1, 2], [1])
+
+    # times are not cast through the data dtype
+    ts = VariableTimeSeries()
+    ts.append(1, 16777217)
+    self.assertEquals(ts.times[0], 16777217)
+
+  def test_resample(self):
+    times = [0, 10, 25, 30, 40, 55, 60, 70, 80, 90, 100]
+    ts = VariableTimeSeries(np.array(times) * 2.0, times, dtype=np.float64)
+    resampled = ts.resample(Frequency(100))
+    self.assertTrue(isinstance(resampled, UniformTimeSeries))
+    self.assertEquals(resampled.offset, 0)
+    assert_array_almost_equal(resampled.data, np.arange(0, 101, 10) * 2.0)
+
+    # a slower frequency is anti-aliased
+    self.assertEquals(len(ts.resample(Frequency(20))), 3)
+    self.assertEquals(len(VariableTimeSeries().resample(Frequency(10))), 0)
+
   def test_get(self):
     ts = VariableTimeSeries(data=[1,2,3], times=[1,2,3])
     self.assertEqual(ts.get(0), 1)
@@ -101,6 +142,12 @@ class VariableTimeSeriesTests(unittest.TestCase):
     self.assertEquals(ts.at(3), 3)
     self.assertEquals(ts.at(2.5), 2.5)
     self.assertRaises(ValueError, ts.at, 4)    
+    assert_array_equal(ts.at([1, 1.5, 3]), [1, 1.5, 3])
+    self.assertRaises(ValueError, ts.at, [2, 4])
+
+    # cached times are invalidated by appending
+    ts.append([5], [5])
+    self.assertEquals(ts.at(4), 4)
 
   def test_duration(self):
     ts = VariableTimeSeries([1,2,3], [1,2,3])
@@ -122,6 +169,17 @@ class VariableTimeSeriesTests(unittest.TestCase):
     assert_array_equal(ts.slice(Epoch(offset=1, length=2)).data, [1,2,3])
     self.assertRaises(ValueError, ts.slice, Epoch(offset=0, length=4))
 
+    # slices are views unless copied
+    sliced = ts.slice(Epoch(offset=2, length=1))
+    self.assertTrue(np.may_share_memory(sliced.data, ts.data))
+    self.assertTrue(np.may_share_memory(sliced.times, ts.times))
+    copied = sliced.copy()
+    copied.data[0] = 5
+    self.assertFalse(np.may_share_memory(copied.data, ts.data))
+    self.assertEquals(ts.data[1], 2)
+    sliced.append(9, 9)
+    assert_array_equal(ts.data, [1,2,3])
+
   def test_equality(self):
     ts1 = VariableTimeSeries([1,2,3], [1,2,3])
     ts2 = VariableTimeSeries([1,2,3,4], [1,2,3,4])
@@ -176,6 +234,60 @@ class TimeSeriesTests(unittest.TestCase):
     self.assertEquals(ts.at(200), 20)
     self.assertEquals(ts.at(1200), 70)
     self.assertRaises(ValueError, ts.at, 1400)
+    assert_array_equal(ts.at([100, 300, 1100]), [15, 25, 65])
+
+    ts = UniformTimeSeries(Frequency(5), [10], offset=400)
+    self.assertEquals(ts.at(400), 10)
+    self.assertRaises(ValueError, ts.at, 0)
+
+  def test_extend(self):
+    ts = UniformTimeSeries(Frequency(5), [1])
+    for i in range(2, 50):
+      ts.append(i)
+    ts.extend(np.arange(50, 60))
+    assert_array_equal(ts.data, range(1, 60))
+    self.assertEquals(ts.data.dtype, np.float32)
+    self.assertEquals(ts.duration, 59 * 200)
+
+  def test_index_at(self):
+    ts = UniformTimeSeries(Frequency(5), [10,20,30], offset=1000)
+    self.assertEquals(ts.index_at(0), 0)
+    self.assertEquals(ts.index_at(1000), 0)
+    self.assertEquals(ts.index_at(1100), 1)
+    self.assertEquals(ts.index_at(1400), 2)
+    self.assertRaises(ValueError, ts.index_at, 1401)
+    assert_array_equal(ts.indices_at([1000, 1200, 1300]), [0, 1, 2])
+
+  def test_times(self):
+    ts = UniformTimeSeries(Frequency(5), [10,20,30,40], offset=1000)
+    times = ts.times
+    self.assertTrue(isinstance(times, UniformTimes))
+    self.assertEquals(len(times), 4)
+    self.assertEquals(times[0], 1000)
+    self.assertEquals(times[-1], 1600)
+    self.assertEquals(list(times), [1000, 1200, 1400, 1600])
+    assert_array_equal(times, [1000, 1200, 1400, 1600])
+    assert_array_equal(times[[0, 2]], [1000, 1400])
+    self.assertEquals(times[1:], UniformTimes(1200, 200, 3))
+    self.assertEquals(times[::2], UniformTimes(1000, 400, 2))
+    self.assertEquals(times.searchsorted(1200), 1)
+    self.assertEquals(times.searchsorted(1200, 'right'), 2)
+    assert_array_equal(times.searchsorted([0, 1100, 2000]), [0, 1, 4])
+    self.assertRaises(IndexError, times.__getitem__, 4)
+
+    # arithmetic with scalars is uniform, otherwise it is done on an array
+    self.assertEquals(times.dtype, np.asarray(times).dtype)
+    self.assertEquals(time(times, 's'), UniformTimes(1.0, 0.2, 4))
+    assert_array_equal(time(times, 's'), [1.0, 1.2, 1.4, 1.6])
+    self.assertEquals(times + 100, UniformTimes(1100, 200, 4))
+    self.assertEquals(100 + times, UniformTimes(1100, 200, 4))
+    self.assertEquals(times - 1000, UniformTimes(0, 200, 4))
+    assert_array_equal(2000 - times, [1000, 800, 600, 400])
+    self.assertEquals(2 * times, UniformTimes(2000, 400, 4))
+    assert_array_equal(times / 3, np.asarray(times) / 3)
+    self.assertEquals(times / 1000.0, UniformTimes(1.0, 0.2, 4))
+    assert_array_equal(times + [0, 1, 2, 3], [1000, 1201, 1402, 1603])
+    assert_array_equal(4800 / times, [4, 4, 3, 3])
 
   def test_slice(self):
     ts = UniformTimeSeries(Frequency(5), [10,20,30,40,50,60,70])
@@ -184,6 +296,18 @@ class TimeSeriesTests(unittest.TestCase):
     assert_array_equal(ts.slice(Epoch(length=ts.end_time)).data, ts.data)
     self.assertRaises(ValueError, ts.slice, Epoch(offset=0, length=1600))
 
+    # aligned slices are views, otherwise samples are interpolated
+    sliced = ts.slice(Epoch(offset=400, length=400))
+    assert_array_equal(sliced.data, [30,40])
+    self.assertEquals(sliced.offset, 400)
+    self.assertTrue(np.may_share_memory(sliced.data, ts.data))
+    self.assertFalse(np.may_share_memory(sliced.copy().data, ts.data))
+    sliced = ts.slice(Epoch(offset=300, length=400))
+    assert_array_equal(sliced.data, [25,35])
+    self.assertFalse(np.may_share_memory(sliced.data, ts.data))
+    self.assertRaises(ValueError, ts.slice, Epoch(offset=-200, length=400))
+    self.assertRaises(ValueError, ts.slice, Epoch(offset=1300, length=400))
+
   def test_downsample(self):
     ts = UniformTimeSeries(Frequency(10), [10,20,30,40,50,60,70,80,90,100])
     self.assertEqual(len(ts.resample(Frequency(5))), 5)
@@ -192,6 +316,25 @@ class TimeSeriesTests(unittest.TestCase):
     ts = UniformTimeSeries(Frequency(5), [])
     self.assertEqual(len(ts.resample(Frequency(1))), 0)    
 
+  def test_resample(self):
+    data = np.sin(np.arange(1000) / 10.0)
+    ts = UniformTimeSeries(Frequency(200), data, offset=1000, dtype=np.float64)
+    resampled = ts.resample(Frequency(120))
+    self.assertEquals(len(resampled), 600)
+    self.assertEquals(resampled.offset, 1000)
+    try:
+      from scipy.signal import resample_poly
+      assert_array_almost_equal(resampled.data, resample_poly(data, 3, 5))
+    except ImportError:
+      pass
+
+    # long arrays are resampled in chunks with the same result
+    resampler = Resampler.from_frequencies(Frequency(200), Frequency(120))
+    self.assertEquals((resampler.up, resampler.down), (3, 5))
+    assert_array_almost_equal(resampler(data, size=7), resampled.data)
+    self.assertEquals(sum(len(c) for c in resampler.chunks(data, 64)), 600)
+    self.assertRaises(ValueError, Resampler, 0, 1)
+
   def test_upsample(self):
     ts = UniformTimeSeries(Frequency(5), [10,20,30,40,50,60,70,80,90,100])
     self.assertEqual(len(ts.resample(Frequency(10))), 20)
@@ -223,6 +366,124 @@ class TimeSeriesTests(unittest.TestCase):
     self.assertEqual(ts1.min, 10)
     self.assertEqual(ts1.max, 100)
 
+  def test_summary(self):
+    ts = UniformTimeSeries(Frequency(5), [10,20,30,40], offset=100)
+    summary = ts.summary
+    self.assertEqual(summary.count, 4)
+    self.assertEqual(summary.mean, 25)
+    self.assertEqual(summary.sum_squares, 3000)
+    self.assertEqual(summary.first_time, 100)
+    self.assertEqual(summary.last_time, 700)
+    self.assertEqual(summary.variance, 125)
+
+    merged = UniformTimeSeries(Frequency(5), [10,20]).summary.merge(
+      UniformTimeSeries(Frequency(5), [30,40], offset=400).summary)
+    self.assertEqual(merged, Summary(4, 10, 40, 25, 3000, 0, 600))
+    self.assertEqual(merged.merge(Summary()), merged)
+
+    # a stored summary answers without the data (until it is appended to)
+    ts._summary = Summary(4, -1, 1, 0)
+    self.assertEqual((ts.min, ts.max, ts.mean), (-1, 1, 0))
+    ts.append(50)
+    self.assertEqual((ts.min, ts.max, ts.mean), (10, 50, 30))
+
+class EnvelopeTests(unittest.TestCase):
+  def test_envelope(self):
+    data = np.sin(np.arange(1000) / 10.0).astype(np.float32)
+    envelope = Envelope.from_data(data)
+    self.assertEqual(envelope.size, 1000)
+    self.assertEqual([len(l) for l in envelope.levels], [63, 32, 16, 8, 4, 2, 1])
+    self.assertAlmostEqual(envelope.levels[-1][0, 0], data.min())
+    self.assertAlmostEqual(envelope.levels[-1][0, 1], data.max())
+    self.assertAlmostEqual(envelope.levels[-1][0, 2], data.mean(), 5)
+    self.assertAlmostEqual(envelope.levels[0][-1, 2], data[992:].mean(), 5)
+    restored = Envelope.from_array(envelope.to_array(), 1000)
+    [assert_array_equal(a, b) for a, b in zip(restored.levels, envelope.levels)]
+
+    ts = UniformTimeSeries(Frequency.from_interval(10), data, offset=100)
+    times, mins, maxs, means = ts.envelope(Epoch(10000, 100), 100)
+    self.assertEqual(len(times), 63)
+    self.assertEqual(times[1], 100 + 16 * 10)
+    assert_array_equal(mins, envelope.levels[0][:, 0])
+    times, mins, maxs, means = ts.envelope(Epoch(10000, 100), 20)
+    self.assertEqual(len(times), 16)
+    self.assertEqual(times[1], 100 + 64 * 10)
+
+    # few enough samples are returned as they are
+    times, mins, maxs, means = ts.envelope(Epoch(95, 200), 100)
+    assert_array_equal(times, np.arange(200, 300, 10))
+    assert_array_equal(mins, data[10:20])
+    assert_array_equal(maxs, data[10:20])
+
+    ts = VariableTimeSeries(data, np.arange(1000) * 2)
+    times, mins, maxs, means = ts.envelope(Epoch(1000, 1000), 10)
+    assert_array_equal(times, np.arange(448, 1000, 64) * 2)
+    self.assertAlmostEqual(mins.min(), data[448:].min())
+    ts.append(5, 2000)
+    self.assertEqual(ts.pyramid.size, 1001)
+
+class RingTimeSeriesTests(unittest.TestCase):
+  def test_variable(self):
+    ts = RingVariableTimeSeries(5, [1,2,3], [10,20,30])
+    self.assertEquals(ts.capacity, 5)
+    self.assertRaises(ValueError, RingVariableTimeSeries, 0)
+    rings = ts._rings
+    for i in range(4, 50):
+      ts.append(i, i * 10)
+      self.assertEquals(len(ts), min(i, 5))
+      assert_array_equal(ts.data, range(max(i - 4, 1), i + 1))
+      assert_array_equal(ts.times, np.arange(max(i - 4, 1), i + 1) * 10)
+    ts.extend(range(50, 53), [500, 510, 520])
+    assert_array_equal(ts.data, [48, 49, 50, 51, 52])
+    assert_array_equal(ts.times, [480, 490, 500, 510, 520])
+    self.assertTrue(ts._rings is rings)
+    self.assertRaises(ValueError, ts.extend, [1, 2], [1])
+
+    self.assertEquals(ts.min, 48)
+    self.assertEquals(ts.max, 52)
+    self.assertEquals(ts.at(505), 50.5)
+    self.assertRaises(ValueError, ts.at, 470)
+    sliced = ts.slice(Epoch(20, 490))
+    assert_array_equal(sliced.data, [49, 50, 51])
+    ts.extend(range(0, 12), range(1000, 1012))
+    assert_array_equal(sliced.data, [49, 50, 51])
+    assert_array_equal(sliced.times, [490, 500, 510])
+
+    assert_array_equal(ts.data, range(7, 12))
+    assert_array_equal(ts.times, range(1007, 1012))
+
+    # the rings agree when scalars and arrays are mixed
+    ts = RingVariableTimeSeries(1)
+    for data, times in [(10, [1]), ([20], 2), (30, [3]), (40, 4), ([50], [5])]:
+      ts.extend(data, times)
+      assert_array_equal(ts.data, np.atleast_1d(data))
+      assert_array_equal(ts.times, np.atleast_1d(times))
+
+  def test_uniform(self):
+    ts = RingUniformTimeSeries(Frequency(5), 4, [1,2,3], offset=1000)
+    self.assertEquals(ts.offset, 1000)
+    ts.append(4)
+    ts.append(5)
+    assert_array_equal(ts.data, [2, 3, 4, 5])
+    self.assertEquals(ts.offset, 1200)
+    ts.extend([6, 7, 8, 9, 10])
+    assert_array_equal(ts.data, [7, 8, 9, 10])
+    self.assertEquals(ts.offset, 2200)
+    self.assertEquals(ts.end_time, 3000)
+    assert_array_equal(ts.times, [2200, 2400, 2600, 2800])
+
+    self.assertEquals(ts.at(2300), 7.5)
+    self.assertRaises(ValueError, ts.at, 2000)
+    assert_array_equal(ts.slice(Epoch(400, 2400)).data, [8, 9])
+    self.assertEquals(ts.min, 7)
+    self.assertEquals(ts.max, 10)
+
+    # slices are not overwritten by later appends
+    ts = RingUniformTimeSeries(Frequency(5), 4, [1,2,3,4])
+    sliced = ts.slice(Epoch(400))
+    ts.extend([5, 6, 7, 8, 9])
+    assert_array_equal(sliced.data, [1, 2])
+
 class TestConversion(unittest.TestCase):
   def test_time(self):
     self.assertEquals(time(1000, 's'), 1)